@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# cachefile.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import time
+
+import lbxml
+from fileutil import make_dirs
+
+# The scraper cache can be shared by several processes, or by several machines
+# on a network share, so files are always replaced atomically and entries that
+# are read, updated and written back are protected by a lock file.
+CACHE_DIR = 'cache'
+
+# Seconds to wait for a lock, and the age of a lock file that is assumed to
+# have been left behind by a crashed process
+CACHE_LOCK_TIMEOUT = 120
+CACHE_LOCK_STALE = 600
+CACHE_LOCK_POLL = 0.05
+
+class CacheLock(object):
+    """
+    Lock on a cache file, held by creating "<file>.lock" exclusively.  This
+    works on Windows and on network shares where fcntl locks are unreliable.
+    Use it in a with statement.
+    """
+    def __init__(self, path, timeout=CACHE_LOCK_TIMEOUT, stale=CACHE_LOCK_STALE):
+        self.lockFileName = path + '.lock'
+        self.timeout = timeout
+        self.stale = stale
+
+    def Acquire(self):
+        make_dirs(os.path.dirname(self.lockFileName))
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.lockFileName, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()))
+                os.close(fd)
+                return
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            if self.BreakStale():
+                continue
+            if time.time() - start > self.timeout:
+                raise CacheLockError(self.lockFileName)
+            time.sleep(CACHE_LOCK_POLL)
+
+    def BreakStale(self):
+        """
+        Removes the lock if it is stale.  Returns True if the lock is gone
+        and can be taken.
+        Only one process breaks a lock at a time, holding "<file>.lock.break".
+        Otherwise two waiters could both find the lock stale, and the second
+        would remove the new lock the first had just created.
+        """
+        breakFileName = self.lockFileName + '.break'
+        try:
+            if time.time() - os.path.getmtime(self.lockFileName) <= self.stale:
+                return False
+            fd = os.open(breakFileName, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                # The holder released the lock while we were looking at it
+                return True
+            if exc.errno != errno.EEXIST:
+                raise
+            # Another process is breaking the lock.  It only holds the
+            # break file for a moment, so an old one was left by a crash.
+            try:
+                if time.time() - os.path.getmtime(breakFileName) > self.stale:
+                    os.remove(breakFileName)
+            except OSError:
+                pass
+            return False
+        os.close(fd)
+        try:
+            # Check again, the lock may have been broken and taken again
+            # since we looked at it
+            if time.time() - os.path.getmtime(self.lockFileName) <= self.stale:
+                return False
+            print("    Removing stale lock: %s" % self.lockFileName)
+            os.remove(self.lockFileName)
+        except OSError:
+            # The holder released the lock while we were looking at it
+            pass
+        finally:
+            os.remove(breakFileName)
+        return True
+
+    def Release(self):
+        try:
+            os.remove(self.lockFileName)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.Acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Release()
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def read_xml( path, backend=None ):
+    """
+    Parses a cached xml file.  Returns None if the file does not exist, or if
+    it is damaged, in which case it is removed so it will be fetched again.
+    """
+    try:
+        return lbxml.parse(path, backend)
+    except IOError:
+        # lxml reports a missing file without an errno
+        if os.path.exists(path):
+            raise
+        return None
+    except lbxml.ParseErrors as e:
+        print("    Removing damaged cache file: %s (%s)" % (path, e))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+###############################################################################
+# EXCEPTIONS
+###############################################################################
+
+class Error(Exception):
+    pass
+
+class CacheLockError(Error):
+    def __init__(self, lockFileName):
+        self.lockFileName = lockFileName
+    def __str__(self):
+        return "Timed out waiting for cache lock %s, remove it if no other scraper is running" % self.lockFileName
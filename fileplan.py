@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+# fileplan.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import json
+import shutil
+import codecs
+import filecmp
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from fileutil import make_dirs
+
+PLAN_RENAME = 'rename'
+PLAN_MOVE = 'move'
+
+PLAN_DEFAULT_WORKERS = 8
+# Moves between devices copy the whole file, running many at once only
+# makes the disks seek, so they use a smaller pool
+PLAN_COPY_WORKERS = 2
+
+class FilePlan(object):
+    """
+    A list of file operations computed before anything is modified.  Plans
+    are saved as json so they can be reviewed, applied later and resumed.
+    Each operation is a list of [ operation, source, destination ].
+    """
+    def __init__(self, operations=None):
+        self.operations = operations if operations is not None else []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def Add(self, operation, src, dst):
+        # A relative path would be resolved against whatever directory the
+        # plan is applied from
+        if not os.path.isabs(src) or not os.path.isabs(dst):
+            raise ValueError("Plan paths must be absolute: %s to %s" % (src, dst))
+        self.operations.append([operation, src, dst])
+
+    def Extend(self, plan):
+        self.operations.extend(plan.operations)
+
+    def RemoveConflicts(self, verbose=False, checkFiles=True):
+        """
+        Removes and returns the operations that can't be applied safely:
+        a missing source, an existing destination, two operations with the
+        same source or destination, or a destination that another operation
+        uses as its source (the result would depend on the order).  Plans
+        built from directory listings can skip the per file checks with
+        checkFiles=False.
+        """
+        dstCount = {}
+        srcCount = {}
+        for operation, src, dst in self.operations:
+            dstCount[os.path.normcase(dst)] = dstCount.get(os.path.normcase(dst), 0) + 1
+            srcCount[os.path.normcase(src)] = srcCount.get(os.path.normcase(src), 0) + 1
+
+        operations = []
+        conflicts = []
+        for entry in self.operations:
+            operation, src, dst = entry
+            if dstCount[os.path.normcase(dst)] > 1:
+                reason = "Multiple files would be written to the destination"
+            elif srcCount[os.path.normcase(src)] > 1:
+                reason = "Source is used by multiple operations"
+            elif os.path.normcase(dst) in srcCount:
+                reason = "Destination is the source of another operation"
+            elif checkFiles and not os.path.exists(src):
+                reason = "Source does not exist"
+            elif checkFiles and os.path.exists(dst):
+                reason = "Destination already exists"
+            else:
+                operations.append(entry)
+                continue
+            conflicts.append((entry, reason))
+            if verbose:
+                print( ("Conflict: %s %s to %s (%s)" % (operation, src, dst, reason)).encode('utf-8') )
+        self.operations = operations
+        return conflicts
+
+    def Print(self):
+        for operation, src, dst in self.operations:
+            print( ("%s %s to %s" % (PLAN_DESCRIPTIONS[operation], src, dst)).encode('utf-8') )
+
+    def Save(self, planFileName):
+        with codecs.open(planFileName, 'w', 'utf-8') as f:
+            json.dump({ 'operations': self.operations }, f, indent=0, ensure_ascii=False)
+        # A new plan starts with a new journal
+        if os.path.exists(planFileName+'.journal'):
+            os.remove(planFileName+'.journal')
+
+    @classmethod
+    def Load(cls, planFileName):
+        with codecs.open(planFileName, 'r', 'utf-8') as f:
+            return cls(json.load(f)['operations'])
+
+PLAN_DESCRIPTIONS = { PLAN_RENAME: "Renaming", PLAN_MOVE: "Moving", }
+
+class Journal(object):
+    """
+    Records which operations of a plan have been completed so an interrupted
+    run can be resumed or undone.  Each line is "<state> <operation index>".
+    """
+    def __init__(self, journalFileName):
+        self.journalFileName = journalFileName
+
+    def Read(self):
+        """ Returns the set of operation indexes that are currently applied """
+        applied = set()
+        if not os.path.exists(self.journalFileName):
+            return applied
+        with open(self.journalFileName, 'r') as f:
+            for line in f:
+                try:
+                    state, index = line.split()
+                    index = int(index)
+                except ValueError:
+                    # The last line may be incomplete after a crash
+                    continue
+                if state == 'done':
+                    applied.add(index)
+                elif state == 'undone':
+                    applied.discard(index)
+        return applied
+
+    def Exists(self):
+        return os.path.exists(self.journalFileName)
+
+    def Open(self):
+        self.f = open(self.journalFileName, 'a+')
+        # Terminate an incomplete last line so it isn't joined to our first entry
+        self.f.seek(0, os.SEEK_END)
+        if self.f.tell() > 0:
+            self.f.seek(-1, os.SEEK_END)
+            if self.f.read(1) != '\n':
+                self.f.seek(0, os.SEEK_END)
+                self.f.write('\n')
+
+    def Write(self, state, index):
+        self.f.write("%s %d\n" % (state, index))
+        # Flush each entry so the journal is accurate if we are interrupted
+        self.f.flush()
+
+    def Close(self):
+        self.f.close()
+
+def ApplyPlan( plan, journalFileName, workers=PLAN_DEFAULT_WORKERS, verbose=False ):
+    """
+    Applies the operations of a plan that are not already recorded in the
+    journal, using a pool of worker threads.  Returns the number of operations
+    applied and the number that failed.
+    """
+    journal = Journal(journalFileName)
+    applied = journal.Read()
+    pending = [ (i, plan.operations[i]) for i in range(len(plan.operations)) if i not in applied ]
+    if applied:
+        print("Resuming plan, %d of %d operations already applied." % (len(applied), len(plan.operations)))
+    return run_operations(pending, journal, 'done', workers, verbose)
+
+def UndoPlan( plan, journalFileName, workers=PLAN_DEFAULT_WORKERS, verbose=False ):
+    """ Reverses the operations of a plan that the journal records as applied """
+    journal = Journal(journalFileName)
+    applied = journal.Read()
+    pending = []
+    for i in sorted(applied, reverse=True):
+        operation, src, dst = plan.operations[i]
+        pending.append((i, [operation, dst, src]))
+    return run_operations(pending, journal, 'undone', workers, verbose)
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def run_operations( pending, journal, state, workers, verbose=False ):
+    count = 0
+    failed = 0
+    if not pending:
+        return count, failed
+    operations = dict(pending)
+
+    # A crash between an operation and its journal entry leaves the
+    # operation applied but not recorded.  When resuming, record those
+    # instead of failing on their missing source.
+    recovered = set()
+    if journal.Exists():
+        recovered = set(index for index, (operation, src, dst) in pending if is_completed(operation, src, dst))
+        pending = [ entry for entry in pending if entry[0] not in recovered ]
+
+    # Operations within a device are just renames, moves to another device
+    # are copies and get their own, smaller, pool
+    devices = {}
+    renames = []
+    copies = []
+    for entry in pending:
+        index, (operation, src, dst) = entry
+        if operation == PLAN_MOVE and get_device(src, devices) != get_device(dst, devices):
+            copies.append(entry)
+        else:
+            renames.append(entry)
+
+    journal.Open()
+    try:
+        for index in sorted(recovered):
+            journal.Write(state, index)
+            count += 1
+            if verbose:
+                operation, src, dst = operations[index]
+                print( ("Already %s: %s to %s" % (state, src, dst)).encode('utf-8') )
+        for entries, poolSize in [ (renames, workers), (copies, min(workers, PLAN_COPY_WORKERS)) ]:
+            if not entries:
+                continue
+            pool = ThreadPool(max(1, poolSize))
+            try:
+                # Workers only touch the filesystem, the journal is written here
+                for index, error in pool.imap_unordered(run_operation, entries):
+                    if error:
+                        print( ("Error: %s" % error).encode('utf-8') )
+                        failed += 1
+                    else:
+                        journal.Write(state, index)
+                        count += 1
+                        if verbose:
+                            operation, src, dst = operations[index]
+                            print( ("%s %s to %s" % (PLAN_DESCRIPTIONS[operation], src, dst)).encode('utf-8') )
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        journal.Close()
+    return count, failed
+
+def is_completed( operation, src, dst ):
+    """ True if an operation was applied: its source is gone and its destination exists """
+    if not os.path.lexists(dst):
+        return False
+    if not os.path.lexists(src):
+        return True
+    # A copy to another device that was interrupted before removing its
+    # source, the copy is only moved into place once it is complete
+    if operation == PLAN_MOVE and os.path.isfile(src) and filecmp.cmp(src, dst, False):
+        os.remove(src)
+        return True
+    return False
+
+def get_device( path, devices ):
+    """
+    Returns the device of the nearest existing directory containing path.
+    Results are cached per directory in the devices dictionary.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in devices:
+        parent = directory
+        while not os.path.isdir(parent) and os.path.dirname(parent) != parent:
+            parent = os.path.dirname(parent)
+        try:
+            devices[directory] = os.stat(parent).st_dev
+        except OSError:
+            devices[directory] = None
+    return devices[directory]
+
+def run_operation( entry ):
+    index, (operation, src, dst) = entry
+    if operation not in PLAN_DESCRIPTIONS:
+        return index, "Unknown operation %s" % operation
+    try:
+        # Plans can be applied long after they were built, never replace a
+        # file that has appeared at the destination since
+        if os.path.lexists(dst):
+            raise OSError(errno.EEXIST, "Destination already exists")
+        if operation == PLAN_RENAME:
+            rename_no_clobber(src, dst)
+        elif operation == PLAN_MOVE:
+            make_dirs(os.path.dirname(dst))
+            try:
+                rename_no_clobber(src, dst)
+            except OSError as e:
+                # Windows reports every drive as device 0, so a move that
+                # looked local may still need a copy
+                if not is_cross_device_error(e):
+                    raise
+                copy_no_clobber(src, dst)
+                os.remove(src)
+    except (IOError, OSError) as e:
+        return index, u"%s %s to %s failed: %s" % (PLAN_DESCRIPTIONS[operation], src, dst, e)
+    return index, None
+
+# Windows error for a rename to another drive
+ERROR_NOT_SAME_DEVICE = 17
+
+def is_cross_device_error( e ):
+    return e.errno == errno.EXDEV or getattr(e, 'winerror', None) == ERROR_NOT_SAME_DEVICE
+
+def copy_no_clobber( src, dst ):
+    """
+    Copies src to dst, failing with EEXIST if dst exists.  The copy is made
+    under a temporary name in the destination directory and renamed into
+    place, so an interrupted copy never leaves a partial file at dst.
+    """
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(dst) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        shutil.copy2(src, tmpPath)
+        rename_no_clobber(tmpPath, dst)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+# Errors from os.link on filesystems (or files) that can't be hardlinked
+LINK_UNSUPPORTED_ERRORS = set([ errno.EPERM, errno.EMLINK, errno.ENOSYS, errno.EOPNOTSUPP, getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP) ])
+
+def rename_no_clobber( src, dst ):
+    """
+    Renames src to dst, failing with EEXIST if dst exists.  os.rename replaces
+    an existing destination on POSIX, so the file is linked to its new name
+    and the old name removed instead.  Windows never replaces the destination
+    of a rename.
+    """
+    if os.name == 'nt':
+        os.rename(src, dst)
+        return
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in LINK_UNSUPPORTED_ERRORS:
+            raise
+        # No hardlinks here (eg. FAT or some network shares), the
+        # destination was checked just before
+        if os.path.lexists(dst):
+            raise OSError(errno.EEXIST, "Destination already exists")
+        os.rename(src, dst)
+        return
+    os.unlink(src)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# fileutil.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import tempfile
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def make_dirs( path ):
+    if path and not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError as exc: # Guard against race condition
+            if exc.errno != errno.EEXIST:
+                raise
+
+def write_atomic( path, data ):
+    """
+    Writes data to path so readers see either the old or the new file, never
+    a partial one.  The data is written to a temporary file in the same
+    directory and renamed over the target.
+    """
+    make_dirs(os.path.dirname(path))
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates private files, the files may be shared with other
+        # users and media is hardlinked from the store
+        os.chmod(tmpPath, 0o666 & ~get_umask())
+        try:
+            os.rename(tmpPath, path)
+        except OSError:
+            # Windows will not rename over an existing file
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
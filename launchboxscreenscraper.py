@@ -16,7 +16,6 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
-import xml.etree.ElementTree as ET
 import argparse
 import os
 import shutil
@@ -24,11 +23,19 @@ import codecs
 import urllib2
 import binascii
 import zipfile
-import fnmatch
+import hashlib
+import json
+import glob
 
 # Local imports
 import screenscraper as SS
 import lb2am as LB
+import lbxml
+from mediastore import MediaStore
+from cachefile import CACHE_DIR
+from fileutil import make_dirs, write_atomic
+from romaudit import RomAudit, ROM_CASE_MISMATCH
+from transport import UrlTransport, RecordTransport, ReplayTransport
 
 try:
     from ssmap import SS_SYSTEM_MAP
@@ -70,20 +77,32 @@ ADDITIONAL_MAPPINGS = {
         'Nintendo 64': ['Nintendo 64-VC',],
         }
 
-SS_LOCALE_PREFERENCE = ['us','us1','wor','eu','jp',]
+# Folders inside the cache directory.  Each shard of a sharded scrape writes
+# its results to the shard folder, see MergeShards
+MEDIA_STORE_SUBDIR = 'media'
+SHARD_SUBDIR = 'shards'
 
 class LaunchBoxScreenScraper(object):
     """ """
-    def __init__(self, lbpath, devid, devpassword, softname, ssid, sspassword, useGameTitle=False, verbose=False):
+    def __init__(self, lbpath, devid, devpassword, softname, ssid, sspassword, useGameTitle=False, verbose=False, mediaStoreDir=None, transport=None, shard=None, cachedir=CACHE_DIR, audit=False):
         self.ssparameters = {}
         self.ssparameters['devid'] = devid
         self.ssparameters['devpassword'] = devpassword
         self.ssparameters['softname'] = softname
         self.ssparameters['ssid'] = ssid
         self.ssparameters['sspassword'] = sspassword
+        # All ScreenScraper requests and media downloads go through the same transport
+        self.transport = transport if transport is not None else UrlTransport()
+        self.ssparameters['transport'] = self.transport
+        # The cache may be shared by several scraper processes or machines
+        self.cachedir = cachedir
+        self.ssparameters['cachedir'] = cachedir
+        self.shardDir = os.path.join(cachedir, SHARD_SUBDIR)
         self.verbose = verbose
         self.lbPath = lbpath
         self.useGameTitle = useGameTitle
+        # Check the roms of a platform exist before scraping it
+        self.audit = audit
 
         if len(SS_SYSTEM_MAP) is 0:
             self.ssmap = self.CreateScreenScraperSystemMap('ssmap.py', False)
@@ -92,7 +111,23 @@ class LaunchBoxScreenScraper(object):
 
         self.artDirs = self.CreateLaunchBoxArtFolderMap()
         self.lbToSsMediaMap = LB_TO_SS_MEDIA_MAP
-        self.ssLocalePreference = SS_LOCALE_PREFERENCE
+        self.ssLocalePreference = SS.SS_LOCALE_PREFERENCE
+        if mediaStoreDir is None:
+            mediaStoreDir = os.path.join(cachedir, MEDIA_STORE_SUBDIR)
+        self.mediaStore = MediaStore(mediaStoreDir, verbose)
+
+        # A shard (index, count) only scrapes its part of the games.  Shards
+        # share the cache and media store, but each keeps its own hash cache
+        # and a log of the media it placed so MergeShards can combine them.
+        self.shard = shard
+        self.shardLog = None
+        if shard:
+            shardName = "%dof%d" % shard
+            make_dirs(self.shardDir)
+            self.shardLog = open(os.path.join(self.shardDir, shardName+'.log'), 'a')
+            self.hashCache = SS.HashCache(os.path.join(self.shardDir, 'hashes-'+shardName+'.json'))
+        else:
+            self.hashCache = SS.HashCache(os.path.join(cachedir, SS.SS_HASH_CACHE_FILE))
 
     def CreateScreenScraperSystemMap(self, ssmapFileName, updateSystems):
         """
@@ -104,12 +139,12 @@ class LaunchBoxScreenScraper(object):
         for ssplat in ADDITIONAL_MAPPINGS.keys():
             for lbplat in ADDITIONAL_MAPPINGS[ssplat]:
                 ssmap[lbplat] = ssmap[ssplat]
-        f = open('ssmap.py', 'w')
-        f.write(SS_MAP_HEADER)
+        lines = [ SS_MAP_HEADER ]
         for key in ssmap:
-            f.write('    "%s": "%s",\n' % (key.encode('utf-8'), ssmap[key]))
-        f.write('}')
-        f.close()
+            lines.append('    "%s": "%s",\n' % (key.encode('utf-8'), ssmap[key]))
+        lines.append('}')
+        # Another scraper process may be importing the map
+        write_atomic(ssmapFileName, ''.join(lines))
         return ssmap
 
     def CreateLaunchBoxArtFolderMap( self ):
@@ -118,29 +153,45 @@ class LaunchBoxScreenScraper(object):
         artDirs = { platform: { 'Video': 'd:/...', 'Clear Logo': xxxx, ... }, ... }
         """
         artDirs = {}
-        tree = ET.parse(os.path.join(self.lbPath, 'Data', 'Platforms.xml'))
-        root = tree.getroot()
-        for platformFolder in root.iter('PlatformFolder'):
-            mediaType = platformFolder.find('MediaType').text
-            platformName = platformFolder.find('Platform').text
+        platformsFileName = os.path.join(self.lbPath, 'Data', 'Platforms.xml')
+        for platformFolder in lbxml.iter_records(platformsFileName, 'PlatformFolder', ['MediaType', 'Platform', 'FolderPath']):
+            mediaType = platformFolder['MediaType']
+            platformName = platformFolder['Platform']
             if platformName not in artDirs:
                 artDirs[platformName] = {}
-            artDirs[platformName][mediaType] = platformFolder.find('FolderPath').text
+            artDirs[platformName][mediaType] = platformFolder['FolderPath']
         return artDirs
 
-    def ScrapeAllPlatforms( self ):
-	""" """
-	count = 0
+    def ScrapeAllPlatforms( self, refresh=False ):
+        """ """
+        count = 0
         files = LB.GetLbPlatformFiles( self.lbPath)
         for file in files:
             platformName = LB.LbFilenameToPlatformName(file)
-            count += self.ScrapePlatform(platformName)
-	return count
+            count += self.ScrapePlatform(platformName, refresh=refresh)
+        return count
 
+    def IsMediaCurrent( self, paths, media ):
+        """
+        Returns True if one of the local files has the hash ScreenScraper
+        reports for the media.  Local hashes come from the hash cache, so
+        unchanged files are not read again.
+        """
+        for hashType in [ 'md5', 'sha1', 'crc', ]:
+            expected = media.get(hashType)
+            if expected:
+                for path in paths:
+                    if self.hashCache.Get(path)[hashType].lower() == expected.lower():
+                        return True
+                return False
+        # Without an upstream hash we can't tell, so keep what we have
+        return True
 
-    def ScrapePlatform( self, LbPlatformName, SsPlatformId=None ):
+    def ScrapePlatform( self, LbPlatformName, SsPlatformId=None, refresh=False ):
         """
-        Returns number of items scraped
+        Returns number of items scraped.  With refresh, media previously saved
+        by the scraper is downloaded again if its hash no longer matches the
+        one ScreenScraper reports (changed upstream or corrupt locally).
         """
         mediaCount = 0
         print("\nScraping: %s" % LbPlatformName)
@@ -152,97 +203,191 @@ class LaunchBoxScreenScraper(object):
                 return mediaCount
         platFileName = os.path.join(self.lbPath, 'Data', 'Platforms', LbPlatformName)+'.xml'
         try:
-            tree = ET.parse(platFileName)
+            games = list(lbxml.iter_records(platFileName, 'Game', ['ApplicationPath', 'Title']))
         except:
             if self.verbose:
                 print("  Unable to open LB platform file: '%s'"% platFileName)
             return mediaCount
 
+        audit = None
+        if self.audit:
+            audit = RomAudit(self.lbPath, verbose=self.verbose)
+            audit.Audit([ game["ApplicationPath"] for game in games if game.get("ApplicationPath") ])
+            audit.Report()
+
         platArtDirs = self.artDirs[LbPlatformName]
-        root = tree.getroot()
-        for game in root.iter('Game'):
-            gamePath = game.find("ApplicationPath").text
-            gamePath = os.path.abspath(os.path.join(self.lbPath,gamePath))
+        # Index each media directory once instead of walking it for every game
+        mediaIndexes = {}
+        for mediaType in self.lbToSsMediaMap.keys():
+            mediaIndexes[mediaType] = LB.MediaIndex([os.path.join(self.lbPath,platArtDirs[mediaType])], recursive=True)
+
+        for game in games:
+            if not game.get("ApplicationPath") or not game.get("Title"):
+                continue
+            if self.shard and not in_shard(self.shard, LbPlatformName, game["ApplicationPath"]):
+                continue
+            gamePath = os.path.abspath(os.path.join(self.lbPath,game["ApplicationPath"]))
+            if audit is not None:
+                status, actualPath = audit.GetStatus(game["ApplicationPath"])
+                if audit.IsMissing(game["ApplicationPath"]):
+                    continue
+                if status == ROM_CASE_MISMATCH:
+                    gamePath = actualPath
             gameFileName = os.path.splitext(os.path.basename(gamePath))[0]
-            gameTitle = game.find("Title").text
+            gameTitle = game["Title"]
 
             print("  --- %s ---" % gameTitle.encode('utf-8'))
 
             # Search LB media directories for existing artwork
             mediaNeeded = []
             for mediaType in self.lbToSsMediaMap.keys():
-                foundMedia = False
                 ad = platArtDirs[mediaType]
-                if len(find_files(os.path.join(self.lbPath,ad),gameTitle+'*.*')) > 0:
-                    foundMedia = True
-                elif len(find_files(os.path.join(self.lbPath,ad),gameFileName+'*.*')) > 0:
-                    foundMedia = True
-                if foundMedia is False:
-                    if self.useGameTitle:
-                        fn = os.path.join(self.lbPath,ad,gameTitle)
-                    else:
-                        fn = os.path.join(self.lbPath,ad,gameFileName)
-                    mediaNeeded.append((mediaType,fn))
+                index = mediaIndexes[mediaType]
+                if self.useGameTitle:
+                    fn = os.path.join(self.lbPath,ad,gameTitle)
+                else:
+                    fn = os.path.join(self.lbPath,ad,gameFileName)
+                if index.FindBest(gameTitle) or index.Find(gameFileName):
+                    if not refresh:
+                        continue
+                    # Only media saved under the name we use is refreshed
+                    baseName = os.path.basename(fn)
+                    existing = [ entry[0] for entry in index.Find(baseName) if entry[1] == baseName and entry[2] is None ]
+                    if not existing:
+                        continue
+                    mediaNeeded.append((mediaType,fn,existing))
+                else:
+                    mediaNeeded.append((mediaType,fn,[]))
                     if self.verbose:
                         print("    Missing a %s" % mediaType)
 
             if len(mediaNeeded) > 0:
                 systemid = self.ssmap[LbPlatformName]
+                # Refreshing needs the current media hashes, not the cached ones
+                updateCache = refresh and len([ m for m in mediaNeeded if m[2] ]) > 0
                 try:
-                    ss = SS.GameInfo(systemId=systemid, romPath=gamePath, gameTitle=gameTitle, verbose=self.verbose, **self.ssparameters)
+                    ss = SS.GameInfo(systemId=systemid, romPath=gamePath, gameTitle=gameTitle, updateCache=updateCache, verbose=self.verbose, hashCache=self.hashCache, **self.ssparameters)
                 except SS.RomNotFoundError:
                     print("    Not found in ScreenScraper")
                     continue
-                availableMedia = ss.GetAvailableMedia()
+                except urllib2.URLError as e:
+                    print("    Request failed: %s" % e)
+                    continue
+                availableMedia = ss.GetAvailableMedia(self.ssLocalePreference)
+                if availableMedia is None:
+                    print("    No media in ScreenScraper")
+                    continue
 
                 for mediaToCheck in mediaNeeded:
-                    url = None
+                    media = None
                     # LB media directory may map to multipe SS types
                     for mediaType in self.lbToSsMediaMap[mediaToCheck[0]]:
-                        if mediaType in availableMedia:
-                            locale = availableMedia[mediaType].keys()[0]
-                            if len(availableMedia[mediaType]) > 1:
-                                # Find our preferred locale
-                                for locale in self.ssLocalePreference:
-                                    if locale in availableMedia[mediaType]:
-                                        break
-                                else:
-                                    print("    Did not find a preferred locale from list %s." % availableMedia[mediaType].keys())
-                            url = availableMedia[mediaType][locale]['url']
+                        preferred = availableMedia.GetPreferred(mediaType)
+                        if preferred is not None:
+                            locale, media = preferred
+                            if locale not in self.ssLocalePreference and len(availableMedia.GetLocales(mediaType)) > 1:
+                                print("    Did not find a preferred locale from list %s." % availableMedia.GetLocales(mediaType))
                             if self.verbose:
                                 print("    Getting %s (%s)!" % (mediaType,locale))
                             break
                     else:
                         # Didn't find what we needed, so move on to next
                         continue
+                    url = media.url
+                    md5 = media.md5
                     ext = '.'+url.split('&mediaformat=')[1][:3]
                     filename = mediaToCheck[1]+ext 
-                    if os.path.exists(filename) is False:
+                    existing = mediaToCheck[2]
+                    if existing:
+                        if self.IsMediaCurrent(existing, media):
+                            if self.verbose:
+                                print("    Up to date: %s" % existing[0].encode('utf-8'))
+                            continue
+                        print("    Refreshing: %s" % filename.encode('utf-8'))
+                    elif os.path.exists(filename):
+                        continue
+                    else:
                         print("    Saving: %s" % filename.encode('utf-8'))
-                        if not os.path.exists(os.path.dirname(filename)):
-                            try:
-                                os.makedirs(os.path.dirname(filename))
-                            except OSError as exc: # Guard against race condition
-                                if exc.errno != errno.EEXIST:
-                                    raise
-                        f = open(mediaToCheck[1]+ext,'wb')
-                        response = urllib2.urlopen(url)
-                        f.write(response.read())
-                        f.close()
-                        mediaCount += 1
+                    # Identical media (clones, shared fanart, etc.) is only downloaded once
+                    if not self.mediaStore.Contains(md5) or (existing and not self.mediaStore.Verify(md5)):
+                        try:
+                            md5 = self.mediaStore.Add(self.transport.Get(url), md5)
+                        except urllib2.URLError as e:
+                            print("    Download failed: %s" % e)
+                            continue
+                    elif self.verbose:
+                        print("    Found %s in media store" % md5)
+                    self.mediaStore.Place(md5, filename, replace=True)
+                    if self.shardLog:
+                        self.shardLog.write(json.dumps({ 'platform': LbPlatformName, 'path': os.path.relpath(filename, self.lbPath), 'md5': md5 })+'\n')
+                        self.shardLog.flush()
+                    for oldFilename in existing:
+                        # The refreshed media may have a different extension
+                        if oldFilename != filename:
+                            os.remove(oldFilename)
+                    mediaCount += 1
+        self.hashCache.Save()
+        return mediaCount
+
+    def MergeShards( self ):
+        """
+        Consolidates the results of a sharded scrape.  Media placed by any
+        shard (possibly on another machine with its own LaunchBox copy) is
+        placed here from the shared media store, and the shard hash caches
+        are merged into the main hash cache.  Returns the number of media placed.
+        """
+        mediaCount = 0
+        for logFileName in sorted(glob.glob(os.path.join(self.shardDir, '*.log'))):
+            print("Merging: %s" % logFileName)
+            with open(logFileName, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A shard may have been stopped in the middle of a line
+                        continue
+                    filename = os.path.join(self.lbPath, entry['path'])
+                    if os.path.exists(filename):
+                        continue
+                    if not self.mediaStore.Contains(entry['md5']):
+                        print("    Missing from media store: %s" % entry['md5'])
+                        continue
+                    print("    Placing: %s" % filename.encode('utf-8'))
+                    self.mediaStore.Place(entry['md5'], filename)
+                    mediaCount += 1
+
+        for hashFileName in sorted(glob.glob(os.path.join(self.shardDir, 'hashes-*.json'))):
+            shardHashes = SS.HashCache(hashFileName)
+            for path, entry in shardHashes.hashes.items():
+                if path not in self.hashCache.hashes or self.hashCache.hashes[path]['mtime'] < entry['mtime']:
+                    self.hashCache.hashes[path] = entry
+                    self.hashCache.modified = True
+        self.hashCache.Save()
         return mediaCount
 
 ###############################################################################
 # GLOBAL FUNCTIONS
 ###############################################################################
 
-def find_files(directory, pattern='*'):
+def parse_shard( text ):
+    """ Converts 'i/N' (i counts from 1) into an (i, N) tuple """
     try:
-        return [os.path.join(dirpath, f)
-            for dirpath, dirnames, files in os.walk(directory)
-            for f in fnmatch.filter(files, pattern)]
-    except:
-        return []
+        index, count = [ int(n) for n in text.split('/') ]
+    except ValueError:
+        raise ValueError("Shard must be in the form i/N: %s" % text)
+    if count < 1 or index < 1 or index > count:
+        raise ValueError("Shard index must be between 1 and %d: %s" % (count, text))
+    return index, count
+
+def in_shard( shard, platformName, applicationPath ):
+    """
+    Returns True if a game belongs to the shard.  The partition uses a hash
+    of the platform and LB rom path, so every machine and process computes
+    the same split.
+    """
+    index, count = shard
+    key = (platformName + u'|' + applicationPath.replace('\\', '/').lower()).encode('utf-8')
+    return int(hashlib.md5(key).hexdigest(), 16) % count == index - 1
 
 ###############################################################################
 # BASIC TESTS
@@ -250,23 +395,50 @@ def find_files(directory, pattern='*'):
 
 def main():
     import settings
-    test = 2
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('Launchbox_dir', nargs='?', default='..\LaunchBox', help="Base Directory of Launchbox")
+    parser.add_argument('--platform', action="append", default=[], help="Only scrape this LaunchBox platform.  May be repeated.")
+    parser.add_argument('--refresh', action="store_true", help="Download media again when its ScreenScraper hash differs from the local file.")
+    parser.add_argument('--shard', metavar='i/N', help="Only scrape the i'th of N parts of the games, run one process (or machine) per part with a shared cache directory.")
+    parser.add_argument('--merge', action="store_true", help="Place the media found by all shards into this LaunchBox directory and merge their hash caches.")
+    parser.add_argument('--cachedir', default=CACHE_DIR, help="Directory for cached ScreenScraper responses, hashes and media.  May be shared by several scrapers.  Default: %(default)s")
+    parser.add_argument('--audit', action="store_true", help="Check the roms of each platform exist before scraping it and skip the missing ones.")
+    parser.add_argument('--record', metavar='DIR', help="Record all ScreenScraper responses and media to an archive directory.")
+    parser.add_argument('--replay', metavar='DIR', help="Serve ScreenScraper responses and media from an archive directory instead of the network.")
+    parser.add_argument('--latency', type=float, default=0.0, help="With --replay, seconds of latency added to each request.")
+    parser.add_argument('--errorrate', type=float, default=0.0, help="With --replay, fraction of requests that fail with a network error.")
+    parser.add_argument('--maxrate', type=float, default=0.0, help="With --replay, maximum number of requests per second.")
+    parser.add_argument('--verbose', action="store_true")
+    args = parser.parse_args()
 
-    verbose = False
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
 
-    # import ipdb; ipdb.set_trace()
-    lbss = LaunchBoxScreenScraper('..\LaunchBox', settings.devid, settings.devpassword, settings.softname, settings.ssid, settings.sspassword, verbose)
+    if args.replay:
+        transport = ReplayTransport(args.replay, args.latency, args.errorrate, args.maxrate, verbose=args.verbose)
+    elif args.record:
+        transport = RecordTransport(args.record, verbose=args.verbose)
+    else:
+        transport = UrlTransport()
 
-    if test == 1:
-        # lbss.ScrapePlatform("Sega Dreamcast")
-        # lbss.ScrapePlatform("MAME")
-        # lbss.ScrapePlatform("Atari 2600")
-        # lbss.ScrapePlatform("Super Nintendo Entertainment System")
-        # lbss.ScrapePlatform("Microsoft MSX2")
-        lbss.ScrapePlatform("Nintendo GameCube")
+    lbss = LaunchBoxScreenScraper(args.Launchbox_dir, settings.devid, settings.devpassword, settings.softname, settings.ssid, settings.sspassword, verbose=args.verbose, transport=transport, shard=shard, cachedir=args.cachedir, audit=args.audit)
 
-    if test == 2:
-        lbss.ScrapeAllPlatforms()
+    start = time.time()
+    if args.merge:
+        count = lbss.MergeShards()
+    elif args.platform:
+        count = 0
+        for platformName in args.platform:
+            count += lbss.ScrapePlatform(platformName, refresh=args.refresh)
+    else:
+        count = lbss.ScrapeAllPlatforms(args.refresh)
+    print("\nScraped %d media in %.1f seconds." % (count, time.time() - start))
 
 if __name__ == "__main__":
     main()
@@ -16,16 +16,28 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
-import xml.etree.ElementTree as ET
 import argparse
 import os
 import glob
-import shutil
 import codecs
+import sys
+import heapq
+import fnmatch
+import bisect
+import re
+import time
+
+import fileplan
+import lbxml
+import lbwatch
+import romaudit
 
 # Global variable used by lamba
 EmulatorName = ''
 
+# When LB saves image files, it replaces the following chacters with '_'
+LB_FILE_SUB = [ ':', "'", '\\', '/', '"', '?', '<', '>', '!', '|' ]
+
 AM_HEADER = "#Name;Title;Emulator;CloneOf;Year;Manufacturer;Category;Players;Rotation;Control;Status;DisplayCount;DisplayType;AltRomname;AltTitle;Extra;Buttons"
 AM_FIELD_MAP = [
     { "LB_Field": "ApplicationPath",    "AM_Field": "Name",         "MapToAm": (lambda aPath: os.path.splitext(os.path.split(aPath)[1])[0]) },
@@ -46,43 +58,104 @@ AM_FIELD_MAP = [
     { "LB_Field": None,                 "AM_Field": "Extra",        "MapToAm": None },
     { "LB_Field": None,                 "AM_Field": "Buttons",      "MapToAm": None }, ]
 
-def ConvertToAMRomlist( LBPlatformFilePath ):
-    output = ''
-
-    tree = ET.parse(LBPlatformFilePath)
-    root = tree.getroot()
-
-    output += AM_HEADER
-    output += '\n'
+# Mapping functions that can be selected by name when overriding the field map
+# from the command line (eg. --fieldmap "Rotation=Rotation:rotation")
+AM_MAP_FUNCTIONS = {
+    "filename": (lambda aPath: os.path.splitext(os.path.split(aPath)[1])[0]),
+    "year":     (lambda date: date[:4]),
+    "genre":    (lambda genre: genre.replace(';',' / ')),
+    "players":  (lambda players: players.split('-')[-1].strip('+ ')),
+    "rotation": (lambda rotation: { 'vertical': '90', 'horizontal': '0' }.get(rotation.lower(), rotation)),
+}
 
-    # Step through each game on the LaunchBox platform file
-    for game in root.iter('Game'):
-        # Step through each field needed in the AttractMode emulator file
-        for field in AM_FIELD_MAP:
-            t = u''
-            # Check if Launchbox has a field that maps to AttractMode
-            if field["LB_Field"]:
-                try:
-                    t = game.find(field["LB_Field"]).text
-                except:
-                    pass
-            # Modify the Launchbox text if necessary
-            if field["MapToAm"]:
-                try:
-                    t = field["MapToAm"](t)
-                except:
-                    pass
+def ParseFieldMapOverrides( overrides, fieldMap=AM_FIELD_MAP ):
+    """
+    Returns a copy of fieldMap with the overrides applied.  Each override has
+    the form "AM_Field=LB_Field" or "AM_Field=LB_Field:function" where function
+    is one of the keys in AM_MAP_FUNCTIONS.  Without a function the LB value
+    is used as is.  An empty LB_Field clears the entry.
+    """
+    newMap = [ dict(field) for field in fieldMap ]
+    for override in overrides or []:
+        amField, _, lbField = override.partition('=')
+        lbField, _, mapName = lbField.partition(':')
+        for field in newMap:
+            if field["AM_Field"] == amField.strip():
+                break
+        else:
+            raise ValueError("Unknown AttractMode field in field map: %s" % amField)
+        field["LB_Field"] = lbField.strip() or None
+        field["MapToAm"] = AM_MAP_FUNCTIONS[mapName.strip()] if mapName.strip() else None
+    return newMap
+
+class CompiledFieldMap(object):
+    """
+    A field map reduced to the LaunchBox tags it needs and a list of per
+    column operations, so each game is converted without searching its
+    children.  Columns without a LaunchBox source are computed once.
+    """
+    def __init__(self, fieldMap=AM_FIELD_MAP):
+        self.fields = set()
+        self.columns = []
+        for field in fieldMap:
+            lbField = field["LB_Field"]
+            mapToAm = field["MapToAm"]
+            if lbField:
+                self.fields.add(lbField)
+                self.columns.append((lbField, mapToAm, None))
+            else:
+                # Fields without a LaunchBox source are the same for every game
+                constant = u''
+                if mapToAm:
+                    try:
+                        constant = mapToAm(u'') or u''
+                    except Exception:
+                        pass
+                self.columns.append((None, None, constant))
+
+    def BuildRow(self, values):
+        """ Convert a dictionary of LB field values into an AM romlist row """
+        row = []
+        for lbField, mapToAm, constant in self.columns:
+            if lbField is None:
+                row.append(constant)
+                continue
+            t = values.get(lbField)
             if t:
-                output += t
-            # Each entry in AttractMode is separated by a ;
-            output += ';'
-        # We are all done with this entry
-        output += '\n'
-
-    # Sort the romlist
-    output = '\n'.join(sorted(output.strip().split('\n')))
-
-    return output
+                if mapToAm:
+                    try:
+                        t = mapToAm(t)
+                    except Exception:
+                        pass
+                row.append(t or u'')
+            else:
+                row.append(u'')
+        # Each entry in AttractMode is terminated by a ;
+        row.append(u'')
+        return u';'.join(row)
+
+def GetAMRomlistRows( LBPlatformFilePath, fieldMap=AM_FIELD_MAP, audit=None ):
+    """
+    Returns the sorted list of AM romlist rows for a LB platform file.  Games
+    whose rom a RomAudit found missing are left out.
+    """
+    compiled = CompiledFieldMap(fieldMap)
+
+    # Only the tags used by the field map are extracted from each game
+    if audit is None:
+        rows = [ compiled.BuildRow(values) for values in lbxml.iter_records(LBPlatformFilePath, 'Game', compiled.fields) ]
+    else:
+        rows = []
+        for values in lbxml.iter_records(LBPlatformFilePath, 'Game', compiled.fields | set(['ApplicationPath'])):
+            if values.get('ApplicationPath') and audit.IsMissing(values['ApplicationPath']):
+                continue
+            rows.append(compiled.BuildRow(values))
+    rows.sort()
+    return rows
+
+def ConvertToAMRomlist( LBPlatformFilePath, fieldMap=AM_FIELD_MAP, audit=None ):
+    rows = GetAMRomlistRows(LBPlatformFilePath, fieldMap, audit)
+    return '\n'.join([AM_HEADER] + rows)
 
 def GetLbPlatformFiles( LaunchBoxBaseDir ):
     platformsdir = os.path.join(LaunchBoxBaseDir, 'Data', 'Platforms')
@@ -92,17 +165,41 @@ def GetLbPlatformFiles( LaunchBoxBaseDir ):
 def LbFilenameToPlatformName( filename ):
     return os.path.splitext(os.path.split(filename)[1])[0] # Use platform filename as emulator name
 
-def CreateRomlists( LaunchBoxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False ):
+class PlatformSelection(object):
+    """
+    The platforms chosen with --platform and --exclude wildcard patterns,
+    matched without regard to case.  Use "platformName in selection", it can
+    be passed anywhere a list of platform names is accepted.
+    """
+    def __init__(self, include=None, exclude=None):
+        self.include = [ pattern.lower() for pattern in include or [] ]
+        self.exclude = [ pattern.lower() for pattern in exclude or [] ]
+
+    def __contains__(self, platformName):
+        platformName = platformName.lower()
+        if self.include and not [ p for p in self.include if fnmatch.fnmatchcase(platformName, p) ]:
+            return False
+        return not [ p for p in self.exclude if fnmatch.fnmatchcase(platformName, p) ]
+
+def CreateRomlists( LaunchBoxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False, fieldMap=AM_FIELD_MAP, aggregate=False, aggregateFilters=None, platforms=None, audit=None ):
+    """
+    Creates an AttractMode romlist for each LB platform, or only for the
+    platforms listed in platforms.  Aggregate romlists always span every
+    platform.  With a RomAudit, games with missing roms are left out.
+    """
     romlistsdir = os.path.join(AttractModeBaseDir, 'romlists')
     files = GetLbPlatformFiles(LaunchBoxBaseDir)
+    platformNames = [ LbFilenameToPlatformName(file) for file in files ]
     for file in files:
+        if platforms is not None and LbFilenameToPlatformName(file) not in platforms:
+            continue
         print("Extracting ROMS from: "+file)
         # We use EmulatorName in a lamba, which needs to be global
         global EmulatorName
         EmulatorName = LbFilenameToPlatformName(file)
         # LB may use unicode characters, so encode accordingly
         romListFileName = os.path.join(romlistsdir,EmulatorName+'.txt')
-        output = ConvertToAMRomlist(file)
+        output = ConvertToAMRomlist(file, fieldMap, audit)
         print( ("Creating romlist: "+romListFileName).encode('utf-8') )
         if dryrun or verbose:
             if verbose:
@@ -113,6 +210,105 @@ def CreateRomlists( LaunchBoxBaseDir, AttractModeBaseDir, dryrun=False, verbose=
                 fout.write(output)
                 fout.close()
 
+    if aggregate:
+        CreateAggregateRomlists( AttractModeBaseDir, platformNames, aggregateFilters, dryrun, verbose )
+
+AM_COLUMNS = AM_HEADER[1:].split(';')
+AM_ALL_GAMES_ROMLIST = "All Games"
+AM_GENRE_ROMLIST = "Genre - %s"
+AM_DECADE_ROMLIST = "Decade - %s0s"
+
+def ParseAggregateFilters( filters ):
+    """
+    Converts a list of "AM_Field=pattern" strings into a list of
+    (column index, lower case pattern) tuples.  Patterns use shell wildcards.
+    """
+    parsed = []
+    for f in filters or []:
+        amField, _, pattern = f.partition('=')
+        if amField.strip() not in AM_COLUMNS:
+            raise ValueError("Unknown AttractMode field in filter: %s" % amField)
+        parsed.append((AM_COLUMNS.index(amField.strip()), pattern.strip().lower()))
+    return parsed
+
+def ReadAMRomlistRows( romListFileName ):
+    """ Generator returning the rows of an AM romlist, skipping the header """
+    with codecs.open( romListFileName, 'r', 'utf-8') as fin:
+        for line in fin:
+            line = line.rstrip('\r\n')
+            if line and not line.startswith('#'):
+                yield line
+
+def RowMatchesFilters( columns, filters ):
+    for index, pattern in filters:
+        value = columns[index] if index < len(columns) else u''
+        if index == AM_COLUMNS.index("Category"):
+            # A game may have multiple genres, any of them can match
+            values = value.split(' / ')
+        else:
+            values = [value]
+        for v in values:
+            if fnmatch.fnmatchcase(v.lower(), pattern):
+                break
+        else:
+            return False
+    return True
+
+def GetAggregateRomlistNames( columns ):
+    """ Returns the names of the aggregate romlists a row belongs to """
+    names = [AM_ALL_GAMES_ROMLIST]
+    for genre in columns[AM_COLUMNS.index("Category")].split(' / '):
+        genre = genre.strip()
+        if genre:
+            for sub in LB_FILE_SUB:
+                genre = genre.replace( sub, '_' )
+            names.append(AM_GENRE_ROMLIST % genre)
+    year = columns[AM_COLUMNS.index("Year")]
+    if len(year) == 4 and year.isdigit():
+        names.append(AM_DECADE_ROMLIST % year[:3])
+    return names
+
+def CreateAggregateRomlists( AttractModeBaseDir, platformNames, filters=None, dryrun=False, verbose=False ):
+    """
+    Creates romlists spanning all platforms ("All Games", one per genre and one
+    per decade).  Each platform romlist is already sorted, so the aggregates are
+    produced by streaming a k-way merge of those files, which keeps only one
+    row per platform in memory.
+    """
+    romlistsdir = os.path.join(AttractModeBaseDir, 'romlists')
+    filters = ParseAggregateFilters(filters)
+
+    sources = []
+    for platformName in platformNames:
+        romListFileName = os.path.join(romlistsdir, platformName+'.txt')
+        if os.path.isfile(romListFileName):
+            sources.append(ReadAMRomlistRows(romListFileName))
+        else:
+            print( ("Skipping missing romlist: "+romListFileName).encode('utf-8') )
+
+    outputs = {}
+    counts = {}
+    try:
+        for row in heapq.merge(*sources):
+            columns = row.split(';')
+            if filters and not RowMatchesFilters(columns, filters):
+                continue
+            for name in GetAggregateRomlistNames(columns):
+                counts[name] = counts.get(name, 0) + 1
+                if dryrun:
+                    continue
+                if name not in outputs:
+                    fout = codecs.open( os.path.join(romlistsdir, name+'.txt'), 'w', 'utf-8')
+                    fout.write(AM_HEADER)
+                    outputs[name] = fout
+                outputs[name].write('\n'+row)
+    finally:
+        for fout in outputs.values():
+            fout.close()
+
+    for name in sorted(counts.keys()):
+        print( ("Creating romlist: %s (%d games)" % (os.path.join(romlistsdir, name+'.txt'), counts[name])).encode('utf-8') )
+
 ATTRACTMODE_EMULATOR_FILE_FORMAT = """#
 # Generated by lb2am.py - https://github.com/sharkusk/lb2am
 #
@@ -142,97 +338,251 @@ AM_IMAGES = {
 
 AM_IMAGE_REGIONS = [ "United States", "North America", "Europe", "Japan", ]
 
-def CreateAmEmulators( LaunchboxBaseDir, AttractModeBaseDir, RomExt, RocketLauncherBaseDir=None, dryrun=False, verbose=False ):
-    tree = ET.parse(os.path.join(LaunchboxBaseDir, 'Data', 'Emulators.xml'))
-    root = tree.getroot()
+# Used for platforms whose rom extensions can't be inferred from their games
+AM_DEFAULT_ROMEXT = '.smc;.zip;.7z;.nes;.gba;.gb;.rom;.a26;.lnx;.gg;.int;.sms;.nds;.pce;.cue;.pbp;.iso;.cso;.32x;.bin;.rar;.dsk;.mx2;.lha;.n64;.wud;.wux;.rpx;.cdi;.adf;.d64;.t64'
+
+def ParsePlatformRomExtOverrides( overrides ):
+    """
+    Converts overrides of the form "Platform=.ext1;.ext2" into a dictionary
+    of { platformName: romExt }.
+    """
+    platformRomExt = {}
+    for override in overrides or []:
+        platformName, sep, romExt = override.partition('=')
+        if not sep or not platformName.strip() or not romExt.strip():
+            raise ValueError("Expected Platform=.ext1;.ext2: %s" % override)
+        platformRomExt[platformName.strip()] = romExt.strip()
+    return platformRomExt
+
+def GetRomExtensions( applicationPaths ):
+    """
+    Returns the ';' separated extensions of the rom paths, the most common
+    first so AttractMode finds most roms with its first test.
+    """
+    counts = {}
+    for applicationPath in applicationPaths:
+        ext = os.path.splitext(applicationPath.replace('\\', '/'))[1]
+        if ext:
+            counts[ext] = counts.get(ext, 0) + 1
+    return ';'.join(sorted(counts.keys(), key=lambda ext: (-counts[ext], ext.lower())))
+
+def CreateAmEmulators( LaunchboxBaseDir, AttractModeBaseDir, RomExt=None, RocketLauncherBaseDir=None, dryrun=False, verbose=False, platformRomExt=None, platforms=None, audit=None ):
+    """
+    Creates an AttractMode emulator for each LB platform, or only for the
+    platforms listed in platforms.  The rom extensions are taken from
+    platformRomExt, then RomExt, and otherwise inferred from the platform's
+    games.  With a RomAudit, games with missing roms are ignored so their
+    directories aren't added to the rom path.
+    """
+    if platformRomExt is None:
+        platformRomExt = {}
 
     # Emulators and platforms are separated in LB, they are cross referenced through a unique ID
-    EM_FIELDS = [ 'Title', 'ApplicationPath', 'CommandLine', 'NoSpace', 'NoQuotes', ]
+    EM_FIELDS = [ 'ID', 'Title', 'ApplicationPath', 'CommandLine', 'NoSpace', 'NoQuotes', ]
+    EM_PLATFORM_FIELDS = [ 'Emulator', 'Platform', 'Default', 'CommandLine', ]
     emulatordict = {}
+    emulatorPlatforms = []
 
     # Create a dictionary of emulator information we can use when parsing the
     # LB emulator platforms.  Format is as follows:
     # { ID: { "Title": title, "ApplicationPath": path, "CommandLine": cmdline } }
-    for emulator in root.findall('Emulator'):
-        emulatorEntry = {}
-        for field in EM_FIELDS:
-            emulatorEntry[field] = emulator.find(field).text
-        emulatordict[emulator.find('ID').text] = emulatorEntry
+    # Emulators.xml is streamed, only the default emulator of each selected
+    # platform is kept
+    emulatorsFileName = os.path.join(LaunchboxBaseDir, 'Data', 'Emulators.xml')
+    for tag, record in lbxml.iter_tagged_records(emulatorsFileName, { 'Emulator': EM_FIELDS, 'EmulatorPlatform': EM_PLATFORM_FIELDS }):
+        if tag == 'Emulator':
+            emulatordict[record.get('ID')] = record
+        elif record.get('Default') == 'true' and record.get('Platform'):
+            if platforms is None or record['Platform'] in platforms:
+                emulatorPlatforms.append(record)
 
     # Now we can parse each emulator platform and combine with the information
     # stored in the dictionary above to create an AM emulator
-    for emulatorPlatform in root.findall('EmulatorPlatform'):
-        if emulatorPlatform.find('Default').text == 'true':
-            platformName = emulatorPlatform.find('Platform').text
-            print("Creating Emulator: "+platformName)
-
-            if RocketLauncherBaseDir:
-                appPath = os.path.abspath(RocketLauncherBaseDir)
-                commandLine = 'args -s "[emulator]" -r "[name]" -p AttractMode -f "%s"' % os.path.join(os.path.abspath(AttractModeBaseDir), 'attract.exe')
-                romPath = ''
-            else:
-                # Launchbox stores the rom path for each rom, while Attractmode uses
-                # a list of rompaths for each emulator
-                romPath = []
-                try:
-                    plattree = ET.parse(os.path.join(LaunchboxBaseDir, 'Data', 'Platforms', platformName+'.xml'))
-                    platroot = plattree.getroot()
-                    for game in platroot.findall('Game'):
-                        romPath.append(os.path.abspath(os.path.split(game.find('ApplicationPath').text)[0]))
-                except:
-                    pass
-
-                # Remove duplicates and convert to string
-                romPath = list(set(romPath))
-                romPath = ';'.join(romPath)
-
-                # Lookup the application path for this emulator (using our dictionary)
-                appPath = emulatordict[emulatorPlatform.find('Emulator').text]['ApplicationPath']
-                appPath = os.path.abspath(os.path.join(LaunchboxBaseDir, appPath))
-                commandLine = emulatorPlatform.find('CommandLine').text
-                if not commandLine:
-                    commandLine = ''
-                # TODO Map other front-end commandline options between LB and AM
-                if emulatordict[emulatorPlatform.find('Emulator').text]['NoSpace'] == 'false':
-                    commandLine += ' '
-                if emulatordict[emulatorPlatform.find('Emulator').text]['NoQuotes'] == 'true':
-                    commandLine += '[romfilename]'
-                else:
-                    commandLine += '"[romfilename]"'
-            artworkText = ''
-            for artPrefix in AM_IMAGES.keys():
-                artworkText += artPrefix
-                for artDirNames in AM_IMAGES[artPrefix]:
-                    artDirNames = artDirNames % { 'platformName': platformName }
-                    artworkText += os.path.join(os.path.abspath(LaunchboxBaseDir), artDirNames)+';'
-                    for region in AM_IMAGE_REGIONS:
-                        artworkText += os.path.join(os.path.abspath(LaunchboxBaseDir), artDirNames, region)+';'
-                artworkText += '\n'
-
-            output = ATTRACTMODE_EMULATOR_FILE_FORMAT % { "appPath": appPath, "commandLine": commandLine, "romPath": romPath, "romExt": RomExt, "platformName": platformName, "artwork": artworkText }
-
-            # Attractmode uses Unix style paths, so replace the windows \'s
-            output = output.replace('\\', '/').strip()
-
-            platformFileName = os.path.join(AttractModeBaseDir,'emulators',platformName+'.cfg')
-
-            if dryrun or verbose:
-                print( ("Writing emulator file: "+platformFileName).encode('utf-8') )
-                if verbose:
-                    print( output.encode('utf-8') )
-                    print('')
+    for emulatorPlatform in emulatorPlatforms:
+        platformName = emulatorPlatform['Platform']
+        print("Creating Emulator: "+platformName)
+        applicationPaths = []
+
+        if RocketLauncherBaseDir:
+            appPath = os.path.abspath(RocketLauncherBaseDir)
+            commandLine = 'args -s "[emulator]" -r "[name]" -p AttractMode -f "%s"' % os.path.join(os.path.abspath(AttractModeBaseDir), 'attract.exe')
+            romPath = ''
+        else:
+            # Launchbox stores the rom path for each rom, while Attractmode uses
+            # a list of rompaths for each emulator
+            romPath = []
+            try:
+                for game in lbxml.iter_records(os.path.join(LaunchboxBaseDir, 'Data', 'Platforms', platformName+'.xml'), 'Game', ['ApplicationPath']):
+                    if game.get('ApplicationPath'):
+                        if audit is not None and audit.IsMissing(game['ApplicationPath']):
+                            continue
+                        applicationPaths.append(game['ApplicationPath'])
+                        romPath.append(os.path.abspath(os.path.split(game['ApplicationPath'])[0]))
+            except:
+                pass
+
+            # Remove duplicates and convert to string
+            romPath = list(set(romPath))
+            romPath = ';'.join(romPath)
+
+            # Lookup the application path for this emulator (using our dictionary)
+            appPath = emulatordict[emulatorPlatform['Emulator']]['ApplicationPath']
+            appPath = os.path.abspath(os.path.join(LaunchboxBaseDir, appPath))
+            commandLine = emulatorPlatform.get('CommandLine')
+            if not commandLine:
+                commandLine = ''
+            # TODO Map other front-end commandline options between LB and AM
+            if emulatordict[emulatorPlatform['Emulator']]['NoSpace'] == 'false':
+                commandLine += ' '
+            if emulatordict[emulatorPlatform['Emulator']]['NoQuotes'] == 'true':
+                commandLine += '[romfilename]'
             else:
-                with codecs.open( platformFileName, 'w', 'utf-8') as fout:
-                    fout.write(output)
-                    fout.close()
+                commandLine += '"[romfilename]"'
 
-def RenameLBArtwork( LaunchboxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False ):
+        if platformName in platformRomExt:
+            romExt = platformRomExt[platformName]
+        elif RomExt:
+            romExt = RomExt
+        else:
+            romExt = GetRomExtensions(applicationPaths) or AM_DEFAULT_ROMEXT
+
+        artworkText = ''
+        for artPrefix in AM_IMAGES.keys():
+            artworkText += artPrefix
+            for artDirNames in AM_IMAGES[artPrefix]:
+                artDirNames = artDirNames % { 'platformName': platformName }
+                artworkText += os.path.join(os.path.abspath(LaunchboxBaseDir), artDirNames)+';'
+                for region in AM_IMAGE_REGIONS:
+                    artworkText += os.path.join(os.path.abspath(LaunchboxBaseDir), artDirNames, region)+';'
+            artworkText += '\n'
+
+        output = ATTRACTMODE_EMULATOR_FILE_FORMAT % { "appPath": appPath, "commandLine": commandLine, "romPath": romPath, "romExt": romExt, "platformName": platformName, "artwork": artworkText }
+
+        # Attractmode uses Unix style paths, so replace the windows \'s
+        output = output.replace('\\', '/').strip()
+
+        platformFileName = os.path.join(AttractModeBaseDir,'emulators',platformName+'.cfg')
+
+        if dryrun or verbose:
+            print( ("Writing emulator file: "+platformFileName).encode('utf-8') )
+            if verbose:
+                print( output.encode('utf-8') )
+                print('')
+        else:
+            with codecs.open( platformFileName, 'w', 'utf-8') as fout:
+                fout.write(output)
+                fout.close()
+
+# LB numbers each image of a game, eg. "Super Metroid-01.png"
+LB_IMAGE_SEQUENCE = re.compile(r'-(\d\d)$')
+TITLE_TAGS = re.compile(r'[\(\[][^\)\]]*[\)\]]')
+TITLE_SEPARATORS = re.compile(r'[\W_]+', re.UNICODE)
+# Disc, side, revision and version markers of a title (on normalized names,
+# so "v1.1" is "v1 1").  Each needs its number or letter, a bare "CD" or
+# "V" is part of the title: "Sonic CD", "Grand Theft Auto V".
+TITLE_SUFFIX = re.compile(r'^((disc|disk|cd) ?[0-9]{1,2}( of [0-9]{1,2})?|side ?[ab]|rev ?[0-9a-z]( [0-9]{1,2})?|v[0-9]+( [0-9]+)?)$')
+
+def NormalizeTitle( title ):
+    """
+    Reduces a game title or media filename (without extension or image
+    number) to a key that ignores case, punctuation, the characters LB
+    replaces with '_', region/version tags and a leading 'The'.
+    Eg. "The Legend of Zelda: Link's Awakening (USA) [!]" and
+    "Legend of Zelda_ Link_s Awakening" both become
+    "legend of zelda link s awakening".
+    """
+    t = TITLE_TAGS.sub(u' ', title.lower())
+    t = t.replace(u'&', u' and ')
+    words = TITLE_SEPARATORS.sub(u' ', t).split()
+    if words and words[0] == u'the':
+        words = words[1:]
+    return u' '.join(words)
+
+def SplitLbImageName( filename ):
+    """ Returns (name, image number) for a media filename, image number is None if not present """
+    name = os.path.splitext(filename)[0]
+    m = LB_IMAGE_SEQUENCE.search(name)
+    if m:
+        return name[:m.start()], int(m.group(1))
+    return name, None
+
+class MediaIndex(object):
+    """
+    Index of the media files in a set of directories, built by listing each
+    directory once.  Files are found by normalized title with a dictionary
+    lookup, and by disc/revision suffix using a sorted list of keys.
+    """
+    def __init__(self, directories, recursive=False):
+        # { normalized name: [ (path, name, image number), ... ] }
+        self.files = {}
+        # Same entries keyed without spaces to match "Pac-Man" with "PacMan"
+        self.looseFiles = {}
+        for directory in directories:
+            # List with a unicode path so filenames match unicode titles
+            if not isinstance(directory, unicode):
+                directory = directory.decode(sys.getfilesystemencoding() or 'utf-8')
+            if recursive:
+                listing = [ (dirpath, filenames) for dirpath, dirnames, filenames in os.walk(directory) ]
+            else:
+                try:
+                    listing = [ (directory, [ f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f)) ]) ]
+                except OSError:
+                    continue
+            for dirpath, filenames in listing:
+                for filename in filenames:
+                    name, number = SplitLbImageName(filename)
+                    key = NormalizeTitle(name)
+                    entry = (os.path.join(dirpath, filename), name, number)
+                    self.files.setdefault(key, []).append(entry)
+                    self.looseFiles.setdefault(key.replace(u' ', u''), []).append(entry)
+        self.keys = sorted(self.files.keys())
+
+    def __len__(self):
+        return sum([ len(entries) for entries in self.files.values() ])
+
+    def Find(self, title):
+        """ Returns the entries whose normalized name matches the title exactly """
+        return self.files.get(NormalizeTitle(title), [])
+
+    def FindBest(self, title):
+        """
+        Returns the exact matches if there are any, otherwise the best fuzzy
+        match: the same letters ignoring spaces, or a file named after the
+        title plus a disc/revision suffix (eg. "... disc 1", "... rev a").
+        Other longer names are not matched, "Mario" is not "Mario Kart" and
+        "Final Fantasy" is not "Final Fantasy VII".
+        """
+        key = NormalizeTitle(title)
+        if not key:
+            return []
+        if key in self.files:
+            return self.files[key]
+        loose = self.looseFiles.get(key.replace(u' ', u''))
+        if loose:
+            return loose
+        prefix = key + u' '
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            if TITLE_SUFFIX.match(self.keys[i][len(prefix):]):
+                return self.files[self.keys[i]]
+            i += 1
+        return []
+
+def PlanRenameLBArtwork( LaunchboxBaseDir, AttractModeBaseDir, verbose=False, platforms=None ):
+    """ Returns a FilePlan that renames LB artwork to the rom filenames """
+    plan = fileplan.FilePlan()
     romlistsdir = os.path.join(AttractModeBaseDir, 'romlists')
 
     files = glob.glob(os.path.join(romlistsdir,"*.txt"))
     for romListFileName in files:
         platformName = os.path.splitext(os.path.split(romListFileName)[1])[0]
-        print("Renaming artwork for: " + platformName)
+        if platforms is not None and platformName not in platforms:
+            continue
+        platFileName = os.path.join(LaunchboxBaseDir, 'Data', 'Platforms', platformName+'.xml')
+        if not os.path.isfile(platFileName):
+            # Aggregate romlists (eg. "All Games") have no LB platform
+            continue
+        print("Planning artwork renames for: " + platformName)
 
         # Create list of platform specific artwork directories
         artDirs = []
@@ -245,64 +595,229 @@ def RenameLBArtwork( LaunchboxBaseDir, AttractModeBaseDir, dryrun=False, verbose
                 for region in AM_IMAGE_REGIONS:
                     artDirs.append(os.path.join(os.path.abspath(LaunchboxBaseDir), value, region))
 
-        plattree = ET.parse(os.path.join(LaunchboxBaseDir, 'Data', 'Platforms', platformName+'.xml'))
-        platroot = plattree.getroot()
-        for game in platroot.findall('Game'):
+        # One listing of every artwork directory, instead of a glob per game
+        index = MediaIndex(artDirs)
+
+        games = []
+        for game in lbxml.iter_records(platFileName, 'Game', ['ApplicationPath', 'Title']):
+            if not game.get('ApplicationPath') or not game.get('Title'):
+                continue
             # LB uses the game title (not filename) for images when scraping.
             # We need to rename these files to match the rom filename for AM
-            gameFileName = os.path.splitext(os.path.split(game.find('ApplicationPath').text)[1])[0]
-            gameName = game.find('Title').text
-
-            # When LB saves image files, it replaces the following chacters with '_'
-            LB_FILE_SUB = [ ':', "'", '\\', '/', '"', '?', '<', '>', '!', '|' ]
+            gameFileName = os.path.splitext(os.path.split(game['ApplicationPath'])[1])[0]
+            gameName = game['Title']
 
             for sub in LB_FILE_SUB:
                 gameName = gameName.replace( sub, '_' )
+            games.append((gameFileName, gameName))
+
+        # A file named exactly like a game belongs to that game, even when
+        # it also matches another game once normalized (clones such as
+        # "Galaga (Namco rev. B)" and "Galaga (Midway set 1)").  Other games
+        # only match the files that are left.
+        exactImages = set()
+        for gameFileName, gameName in games:
+            for image, name, number in index.Find(gameName):
+                if name == gameName:
+                    exactImages.add(image)
+
+        renamed = set()
+        for gameFileName, gameName in games:
+            # Only the first image of each type in each directory is renamed,
+            # prefer the one named exactly like LB does if several match
+            images = {}
+            for image, name, number in index.Find(gameName):
+                if number != 1 or image in renamed or (image in exactImages and name != gameName):
+                    continue
+                key = (os.path.split(image)[0], os.path.splitext(image)[1].lower())
+                if key not in images or name == gameName:
+                    images[key] = image
 
-            images = []
-            for artDir in artDirs:
-                searchString = os.path.join(artDir,gameName+'-01.*')
-                images.extend(glob.glob(searchString))
-
-            for image in images:
+            for image in images.values():
+                renamed.add(image)
                 # First, extract the extension
                 ext = os.path.splitext(image)[1]
                 # Remove the old filename (keep the path), then append the new filename and old extension
                 newImage = os.path.join(os.path.split(image)[0],gameFileName+ext)
-                if dryrun:
-                    print( ("Renaming "+image+" to "+newImage).encode('utf-8') )
-                else:
-                    try:
-                        os.rename(image,newImage)
-                    except:
-                        print( ("Error when renaming " +image+" to "+newImage).encode('utf-8') )
-
-
-AM_TO_LB_ART_PATH = [
-        ( os.path.join("scraper","%(platformName)s","flyer"),   os.path.join("Images","%(platformName)s","Box - Front") ),
-        ( os.path.join("scraper","%(platformName)s","marquee"), os.path.join("Images","%(platformName)s","Banner") ),
-        ( os.path.join("scraper","%(platformName)s","wheel"),   os.path.join("Images","%(platformName)s","Clear Logo") ),
-        ( os.path.join("scraper","%(platformName)s","fanart"),  os.path.join("Images","%(platformName)s","Fanart - Background") ),
-    ]
-def MergeArtworkToLB( LaunchboxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False ):
-    # import pdb; pdb.set_trace()
+                plan.Add(fileplan.PLAN_RENAME, image, newImage)
+    return plan
+
+def RenameLBArtwork( LaunchboxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False, planFileName=None, savePlanOnly=False, workers=fileplan.PLAN_DEFAULT_WORKERS, platforms=None ):
+    if not planFileName:
+        planFileName = os.path.join(AttractModeBaseDir, 'lb2am-renart.plan')
+    plan = PlanRenameLBArtwork( LaunchboxBaseDir, AttractModeBaseDir, verbose, platforms )
+    RunFilePlan( plan, planFileName, dryrun, verbose, savePlanOnly, workers )
+
+# AttractMode's scraper saves each artwork type to scraper/<platform>/<type>,
+# where the types are the AM_IMAGES names.  Videos are saved with the snaps.
+AM_SCRAPER_DIR = "scraper"
+AM_VIDEO_EXTENSIONS = [ '.mp4', '.flv', '.avi', '.mkv', '.webm', '.mov', '.mpg', '.mpeg', '.m4v', '.wmv', ]
+
+def GetAMToLBArtPaths():
+    """
+    Returns { AM artwork type: (LB image path, LB video path) } using the
+    first Images and Videos folder AM_IMAGES lists for each type (or None).
+    """
+    artPaths = {}
+    for artPrefix in AM_IMAGES.keys():
+        imagePath = None
+        videoPath = None
+        for artDirNames in AM_IMAGES[artPrefix]:
+            mediaDir = artDirNames.split(os.sep)[0]
+            if mediaDir == "Images" and imagePath is None:
+                imagePath = artDirNames
+            elif mediaDir == "Videos" and videoPath is None:
+                videoPath = artDirNames
+        artPaths[artPrefix.split()[-1]] = (imagePath, videoPath)
+    return artPaths
+
+def PlanMergeArtworkToLB( LaunchboxBaseDir, AttractModeBaseDir, verbose=False, platforms=None ):
+    """
+    Returns a FilePlan that moves AM scraper artwork missing from LB.  Every
+    folder is listed once and the missing files are found by set difference.
+    """
+    plan = fileplan.FilePlan()
+    # Plans are applied later and maybe from another directory, use absolute paths
+    LaunchboxBaseDir = os.path.abspath(LaunchboxBaseDir)
+    scraperDir = os.path.join(os.path.abspath(AttractModeBaseDir), AM_SCRAPER_DIR)
+    if not os.path.isdir(scraperDir):
+        return plan
+    artPaths = GetAMToLBArtPaths()
+
+    # Group the scraped files by source and destination folder:
+    # { (srcDir, dstDir): { normcase(fileName): fileName } }
+    moves = {}
     # Get list of directories in AM's scraper directory
-    amScraperPlats = next(os.walk(os.path.join(AttractModeBaseDir, 'scraper')))[1]
+    amScraperPlats = next(os.walk(scraperDir))[1]
     for platformName in amScraperPlats:
-        for artPath in AM_TO_LB_ART_PATH:
-            searchString = os.path.join(AttractModeBaseDir, artPath[0] % { "platformName": platformName }, '*')
-            imagesToMove = glob.glob(searchString)
-            for image in imagesToMove:
-                # Get the filename and add it to the LB art path
-                newPath = os.path.join(LaunchboxBaseDir, artPath[1] % { "platformName": platformName }, os.path.split(image)[1])
-                # Next, see if it exists in LB
-                if os.path.isfile( newPath ):
-                    # File already exists, so we can move to the next one
+        if platforms is not None and platformName not in platforms:
+            continue
+        for artType in next(os.walk(os.path.join(scraperDir, platformName)))[1]:
+            if artType not in artPaths:
+                if verbose:
+                    print( ("Skipping unknown artwork type: %s" % os.path.join(scraperDir, platformName, artType)).encode('utf-8') )
+                continue
+            srcDir = os.path.join(scraperDir, platformName, artType)
+            for fileName in next(os.walk(srcDir))[2]:
+                isVideo = os.path.splitext(fileName)[1].lower() in AM_VIDEO_EXTENSIONS
+                lbPath = artPaths[artType][1 if isVideo else 0]
+                if lbPath is None:
                     continue
-                if dryrun:
-                    print( ("Moving "+image+" to "+newPath).encode('utf-8') )
-                else:
-                    shutil.move(image, newPath)
+                dstDir = os.path.join(LaunchboxBaseDir, lbPath % { "platformName": platformName })
+                moves.setdefault((srcDir, dstDir), {})[os.path.normcase(fileName)] = fileName
+
+    lbFiles = {}
+    for (srcDir, dstDir), fileNames in sorted(moves.items()):
+        if dstDir not in lbFiles:
+            lbFiles[dstDir] = set(os.path.normcase(n) for n in os.listdir(dstDir)) if os.path.isdir(dstDir) else set()
+        for key in sorted(set(fileNames) - lbFiles[dstDir]):
+            plan.Add(fileplan.PLAN_MOVE, os.path.join(srcDir, fileNames[key]), os.path.join(dstDir, fileNames[key]))
+    return plan
+
+def MergeArtworkToLB( LaunchboxBaseDir, AttractModeBaseDir, dryrun=False, verbose=False, planFileName=None, savePlanOnly=False, workers=fileplan.PLAN_DEFAULT_WORKERS, platforms=None ):
+    if not planFileName:
+        planFileName = os.path.join(AttractModeBaseDir, 'lb2am-mergeart.plan')
+    plan = PlanMergeArtworkToLB( LaunchboxBaseDir, AttractModeBaseDir, verbose, platforms )
+    # The plan was built from directory listings, so the files don't need
+    # checking again here.  Each destination is still checked when applied.
+    RunFilePlan( plan, planFileName, dryrun, verbose, savePlanOnly, workers, False )
+
+def RunFilePlan( plan, planFileName, dryrun=False, verbose=False, savePlanOnly=False, workers=fileplan.PLAN_DEFAULT_WORKERS, checkFiles=True ):
+    """
+    Removes conflicting operations from a plan, then prints it (dryrun),
+    saves it for a later --apply (savePlanOnly) or saves and applies it.
+    The journal of applied operations is kept next to the plan file.
+    """
+    conflicts = plan.RemoveConflicts(True, checkFiles)
+    if conflicts:
+        print("Skipping %d conflicting operations." % len(conflicts))
+    if dryrun:
+        plan.Print()
+        return
+    plan.Save(planFileName)
+    print( ("Saved plan with %d operations: %s" % (len(plan), planFileName)).encode('utf-8') )
+    if not savePlanOnly:
+        ApplyFilePlan( planFileName, False, verbose, workers )
+
+def ApplyFilePlan( planFileName, undo=False, verbose=False, workers=fileplan.PLAN_DEFAULT_WORKERS ):
+    """ Applies (or undoes) a saved plan, resuming from its journal """
+    plan = fileplan.FilePlan.Load(planFileName)
+    if undo:
+        count, failed = fileplan.UndoPlan( plan, planFileName+'.journal', workers, verbose )
+        print("Undid %d operations, %d failed." % (count, failed))
+    else:
+        count, failed = fileplan.ApplyPlan( plan, planFileName+'.journal', workers, verbose )
+        print("Applied %d operations, %d failed." % (count, failed))
+
+def AuditLaunchBox( LaunchBoxBaseDir, platforms=None, workers=romaudit.ROM_AUDIT_WORKERS, verbose=False ):
+    """ Checks the roms of every (or the selected) LB platform exist and returns the RomAudit """
+    audit = romaudit.RomAudit(LaunchBoxBaseDir, workers, verbose)
+    applicationPaths = []
+    for file in GetLbPlatformFiles(LaunchBoxBaseDir):
+        if platforms is not None and LbFilenameToPlatformName(file) not in platforms:
+            continue
+        for game in lbxml.iter_records(file, 'Game', ['ApplicationPath']):
+            if game.get('ApplicationPath'):
+                applicationPaths.append(game['ApplicationPath'])
+    print("Auditing %d roms." % len(applicationPaths))
+    audit.Audit(applicationPaths)
+    audit.Report()
+    return audit
+
+def GetChangedPlatforms( LaunchBoxBaseDir, changedPaths ):
+    """
+    Returns (platformNames, emulatorsChanged) for a set of changed LB data
+    files: the platforms whose xml changed, and whether Emulators.xml or
+    Platforms.xml changed, which can affect every emulator.
+    """
+    platformsdir = os.path.normcase(os.path.abspath(os.path.join(LaunchBoxBaseDir, 'Data', 'Platforms')))
+    datadir = os.path.dirname(platformsdir)
+    platformNames = set()
+    emulatorsChanged = False
+    for path in changedPaths:
+        directory, fileName = os.path.split(os.path.abspath(path))
+        directory = os.path.normcase(directory)
+        if directory == platformsdir and os.path.splitext(fileName)[1].lower() == '.xml':
+            platformNames.add(LbFilenameToPlatformName(fileName))
+        elif directory == datadir and fileName.lower() in [ 'emulators.xml', 'platforms.xml' ]:
+            emulatorsChanged = True
+    return platformNames, emulatorsChanged
+
+def WatchLaunchBox( LaunchBoxBaseDir, Regenerate, verbose=False ):
+    """
+    Waits for LaunchBox to change its data files and calls
+    Regenerate(platformNames, emulatorsChanged) for each burst of changes.
+    platformNames is None when every platform must be regenerated.
+    Runs until interrupted.
+    """
+    directories = [ os.path.join(LaunchBoxBaseDir, 'Data'), os.path.join(LaunchBoxBaseDir, 'Data', 'Platforms') ]
+    watcher = lbwatch.create_watcher(directories, verbose)
+    print("Watching %s for changes, press Ctrl-C to stop." % os.path.join(LaunchBoxBaseDir, 'Data'))
+    try:
+        while True:
+            changedPaths = lbwatch.wait_for_changes(watcher)
+            start = time.time()
+            if changedPaths is None:
+                print("Too many changes, regenerating everything.")
+                platformNames, emulatorsChanged = None, True
+            else:
+                platformNames, emulatorsChanged = GetChangedPlatforms(LaunchBoxBaseDir, changedPaths)
+                if verbose:
+                    for path in sorted(changedPaths):
+                        print( ("Changed: %s" % path).encode('utf-8') )
+                if not platformNames and not emulatorsChanged:
+                    continue
+            try:
+                Regenerate(platformNames, emulatorsChanged)
+            except lbxml.ParseErrors + (IOError,) as e:
+                # LaunchBox may still be writing, the next change will retry
+                print("Error while regenerating: %s" % e)
+                continue
+            print("Updated in %.2f seconds." % (time.time() - start))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.Close()
 
 def main():
     parser = argparse.ArgumentParser(fromfile_prefix_chars='_')
@@ -312,27 +827,91 @@ def main():
     parser.add_argument('--genplats', action="store_true", help="Generate AttractMode platforms from Launchbox data.")
     parser.add_argument('--renart', action="store_true", help="Rename artwork in Launchbox to be compatible with AttractMode.  Only the first image for each game in each directory will be renamed.")
     parser.add_argument('--mergeart', action="store_true", help="Move missing artwork from AttractMode's scraper directory to Launchbox directories.")
+    parser.add_argument('--plan', metavar='PLANFILE', help="With --renart or --mergeart, only save the file operations to PLANFILE so they can be reviewed and applied later with --apply.")
+    parser.add_argument('--apply', metavar='PLANFILE', help="Apply a saved plan.  An interrupted apply is resumed from the plan's journal.")
+    parser.add_argument('--undo', metavar='PLANFILE', help="Undo the operations of a plan that its journal records as applied.")
+    parser.add_argument('--workers', type=int, default=fileplan.PLAN_DEFAULT_WORKERS, help="Number of parallel workers used to apply file operations.  Moves to another drive use at most %d." % fileplan.PLAN_COPY_WORKERS)
     parser.add_argument('--dryrun', action="store_true", help="Don't modify or create any files, only print operations that will be performed.")
     parser.add_argument('--verbose', action="store_true", help="Dump the romlist and platform files to the console.")
     parser.add_argument('--rlauncher', default='', help="Specify RocketLauncher executable, emulators are generated using RocketLauncher settings.")
-    parser.add_argument('--romext', default='.smc;.zip;.7z;.nes;.gba;.gb;.rom;.a26;.lnx;.gg;.int;.sms;.nds;.pce;.cue;.pbp;.iso;.cso;.32x;.bin;.rar;.dsk;.mx2;.lha;.n64;.wud;.wux;.rpx;.cdi;.adf;.d64;.t64',
-            help="Override default rom extention (separated by ';')")
+    parser.add_argument('--romext', help="Use these rom extensions (separated by ';') for all platforms instead of the extensions found in each platform's games.")
+    parser.add_argument('--platromext', action="append", default=[], metavar='PLATFORM=ROMEXT',
+            help="Use these rom extensions for one platform, eg. 'Nintendo 64=.n64;.z64'.  May be repeated.")
+    parser.add_argument('--aggregate', action="store_true", help="With --genroms, also generate 'All Games', per genre and per decade romlists across all platforms.")
+    parser.add_argument('--aggfilter', action="append", default=[], metavar='AM_FIELD=PATTERN',
+            help="Only include games in aggregate romlists where the field matches the wildcard pattern, eg. 'Year=198*' or 'Manufacturer=Nintendo'.  May be repeated.")
+    parser.add_argument('--fieldmap', action="append", default=[], metavar='AM_FIELD=LB_FIELD[:FUNCTION]',
+            help="Map a Launchbox field to an AttractMode romlist field, eg. 'Players=MaxPlayers:players'.  Functions: %s.  May be repeated." % ', '.join(sorted(AM_MAP_FUNCTIONS.keys())))
+    parser.add_argument('--platform', action="append", default=[], metavar='PATTERN',
+            help="Only process the Launchbox platforms matching this wildcard pattern, eg. 'Nintendo*'.  May be repeated.")
+    parser.add_argument('--exclude', action="append", default=[], metavar='PATTERN',
+            help="Don't process the Launchbox platforms matching this wildcard pattern.  May be repeated.")
+    parser.add_argument('--audit', action="store_true", help="Check the roms of the Launchbox platforms exist and report missing, moved, case mismatched and unreadable roms.  --genroms and --genplats leave out games with missing roms, roms in directories that can't be read are kept.")
+    parser.add_argument('--watch', action="store_true", help="With --genroms and/or --genplats, keep running and regenerate the romlists and platforms of the Launchbox platforms that change.")
 
-    # TODO Create platform specific rom extensions
-    # TODO Specify single platform
     # TODO Pick absolute or relative paths to be used
     # TODO Overwrite, update or skip if file exists
 
     args = parser.parse_args()
 
+    if args.plan and args.renart and args.mergeart:
+        parser.error("--plan can only be used with one of --renart or --mergeart")
+    if args.watch and not (args.genroms or args.genplats):
+        parser.error("--watch requires --genroms and/or --genplats")
+
+    try:
+        fieldMap = ParseFieldMapOverrides(args.fieldmap)
+    except (ValueError, KeyError) as e:
+        parser.error("Invalid --fieldmap: %s" % e)
+    try:
+        ParseAggregateFilters(args.aggfilter)
+    except ValueError as e:
+        parser.error("Invalid --aggfilter: %s" % e)
+    try:
+        platformRomExt = ParsePlatformRomExtOverrides(args.platromext)
+    except ValueError as e:
+        parser.error("Invalid --platromext: %s" % e)
+
+    platforms = None
+    if args.platform or args.exclude:
+        platforms = PlatformSelection(args.platform, args.exclude)
+
+    audit = None
+    if args.audit:
+        audit = AuditLaunchBox( args.Launchbox_dir, platforms, verbose=args.verbose )
     if args.genroms:
-        CreateRomlists( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose )
+        CreateRomlists( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose, fieldMap, args.aggregate, args.aggfilter, platforms, audit )
     if args.genplats:
-        CreateAmEmulators( args.Launchbox_dir, args.AttractMode_dir, args.romext, args.rlauncher, args.dryrun, args.verbose )
+        CreateAmEmulators( args.Launchbox_dir, args.AttractMode_dir, args.romext, args.rlauncher, args.dryrun, args.verbose, platformRomExt, platforms, audit )
     if args.renart:
-        RenameLBArtwork( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose )
+        RenameLBArtwork( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose, args.plan, bool(args.plan), args.workers, platforms )
     if args.mergeart:
-        MergeArtworkToLB( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose )
+        MergeArtworkToLB( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose, args.plan, bool(args.plan), args.workers, platforms )
+    if args.apply:
+        ApplyFilePlan( args.apply, False, args.verbose, args.workers )
+    if args.undo:
+        ApplyFilePlan( args.undo, True, args.verbose, args.workers )
+
+    if args.watch:
+        def Regenerate( platformNames, emulatorsChanged ):
+            if platformNames is None:
+                platformNames = platforms
+            elif platforms is not None:
+                platformNames = set([ name for name in platformNames if name in platforms ])
+            if emulatorsChanged:
+                emulatorPlatforms = platforms
+            else:
+                emulatorPlatforms = platformNames
+            if audit is not None and (platformNames is None or platformNames):
+                # Only the platforms whose games changed are audited again,
+                # the others (and their emulators) keep their earlier results
+                audit.Update(AuditLaunchBox( args.Launchbox_dir, platformNames, verbose=args.verbose ))
+            if args.genroms and (platformNames is None or platformNames):
+                CreateRomlists( args.Launchbox_dir, args.AttractMode_dir, args.dryrun, args.verbose, fieldMap, args.aggregate, args.aggfilter, platformNames, audit )
+            if args.genplats and (emulatorPlatforms is None or emulatorPlatforms):
+                # The rom paths and extensions of an emulator come from its platform's games
+                CreateAmEmulators( args.Launchbox_dir, args.AttractMode_dir, args.romext, args.rlauncher, args.dryrun, args.verbose, platformRomExt, emulatorPlatforms, audit )
+        WatchLaunchBox( args.Launchbox_dir, Regenerate, args.verbose )
 
 if __name__ == '__main__':
     main()
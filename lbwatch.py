@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# lbwatch.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+# Watches the LaunchBox data files for changes.  inotify is used on Linux,
+# everywhere else the files are polled.  Directories are watched rather than
+# the files themselves since LaunchBox replaces a file when it saves it.
+
+# Seconds without events before a burst of changes is reported, LaunchBox
+# writes several files (and backups) for a single save
+WATCH_DEBOUNCE = 0.25
+WATCH_POLL_INTERVAL = 0.5
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+IN_EVENT_HEADER = struct.Struct('iIII')
+IN_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+class InotifyWatcher(object):
+    """ Reports the files changed in a list of directories using Linux inotify """
+    def __init__(self, directories):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            if isinstance(directory, unicode):
+                directory = directory.encode(sys.getfilesystemencoding())
+            wd = self.libc.inotify_add_watch(self.fd, directory, IN_WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), "Can't watch %s" % directory)
+            self.directories[wd] = directory
+
+    def Read(self, timeout=None):
+        """
+        Waits up to timeout seconds (forever if None) and returns the set of
+        changed paths.  None is returned if events were lost, so the caller
+        should assume everything changed.
+        """
+        try:
+            ready = select.select([self.fd], [], [], timeout)[0]
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64*1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(data, offset)
+            offset += IN_EVENT_HEADER.size
+            name = data[offset:offset+length].rstrip('\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd in self.directories and name:
+                changed.add(os.path.join(self.directories[wd], name))
+        return changed
+
+    def Close(self):
+        os.close(self.fd)
+
+class PollingWatcher(object):
+    """ Reports the files changed in a list of directories by comparing their size and modification time """
+    def __init__(self, directories, interval=WATCH_POLL_INTERVAL):
+        self.directories = directories
+        self.interval = interval
+        self.snapshot = self.Snapshot()
+
+    def Snapshot(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    # Removed while we were listing
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime)
+        return snapshot
+
+    def Read(self, timeout=None):
+        """ Waits up to timeout seconds (forever if None) and returns the set of changed paths """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            delay = self.interval if deadline is None else min(self.interval, max(0, deadline - time.time()))
+            time.sleep(delay)
+            snapshot = self.Snapshot()
+            changed = set(path for path in set(snapshot) | set(self.snapshot) if snapshot.get(path) != self.snapshot.get(path))
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.time() >= deadline):
+                return changed
+
+    def Close(self):
+        pass
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def create_watcher( directories, verbose=False ):
+    """ Returns an InotifyWatcher if inotify is available, otherwise a PollingWatcher """
+    try:
+        watcher = InotifyWatcher(directories)
+        if verbose:
+            print("Watching with inotify.")
+        return watcher
+    except (ImportError, AttributeError, OSError, TypeError):
+        # No ctypes, a libc without inotify or not Linux at all
+        if verbose:
+            print("Watching by polling every %.1f seconds." % WATCH_POLL_INTERVAL)
+        return PollingWatcher(directories)
+
+def wait_for_changes( watcher, debounce=WATCH_DEBOUNCE ):
+    """
+    Waits for a change and returns the paths changed until no more events
+    arrive for debounce seconds.  Returns None if events were lost.
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.Read()
+        if changed is None:
+            return None
+    while True:
+        more = watcher.Read(debounce)
+        if more is None:
+            return None
+        if not more:
+            return changed
+        changed |= more
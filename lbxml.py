@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# lbxml.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import xml.etree.ElementTree
+
+# XML parsing for LaunchBox data files and ScreenScraper responses.  The
+# fastest available backend is used: lxml, then the C ElementTree, then the
+# pure python ElementTree.  All of them return the same results.
+XML_BACKENDS = {}
+XML_BACKENDS['ElementTree'] = xml.etree.ElementTree
+try:
+    import xml.etree.cElementTree
+    XML_BACKENDS['cElementTree'] = xml.etree.cElementTree
+except ImportError:
+    pass
+try:
+    from lxml import etree
+    XML_BACKENDS['lxml'] = etree
+except ImportError:
+    pass
+
+XML_BACKEND_PREFERENCE = [ 'lxml', 'cElementTree', 'ElementTree', ]
+
+for XML_BACKEND in XML_BACKEND_PREFERENCE:
+    if XML_BACKEND in XML_BACKENDS:
+        ET = XML_BACKENDS[XML_BACKEND]
+        break
+
+# Exceptions raised for malformed xml by any of the backends
+ParseErrors = tuple(set([ getattr(backend, 'ParseError', getattr(backend, 'XMLSyntaxError', SyntaxError)) for backend in XML_BACKENDS.values() ]))
+
+def parse( source, backend=None ):
+    """ Parses a file into an element tree """
+    try:
+        return XML_BACKENDS.get(backend, ET).parse(source)
+    except IOError as exc:
+        # lxml reports a missing file without an errno, raise what the
+        # other backends do
+        if exc.errno is None and isinstance(source, basestring) and not os.path.exists(source):
+            raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), source)
+        raise
+
+def fromstring( text, backend=None ):
+    """ Parses an utf-8 encoded string into an element """
+    return XML_BACKENDS.get(backend, ET).fromstring(text)
+
+def iter_records( source, recordTag, fields, backend=None ):
+    """
+    Yields a dictionary of { field: text } for each recordTag element of a
+    file, eg. iter_records('NES.xml', 'Game', ['Title', 'ApplicationPath']).
+    Only the requested child tags are collected and each record is released
+    once it has been read, so the whole tree is never held in memory.
+    """
+    fields = set(fields)
+    for event, elem in XML_BACKENDS.get(backend, ET).iterparse(source, events=('end',)):
+        if elem.tag != recordTag:
+            continue
+        values = {}
+        for child in elem:
+            if child.tag in fields:
+                values[child.tag] = child.text
+        yield values
+        elem.clear()
+
+def iter_tagged_records( source, recordFields, backend=None ):
+    """
+    Like iter_records for files with several kinds of records.  recordFields
+    is { recordTag: fields } and (recordTag, { field: text }) is yielded for
+    each record (a child of the root element), in file order.
+    """
+    recordFields = dict([ (tag, set(fields)) for tag, fields in recordFields.items() ])
+    # Records are the children of the root element, a field can have the
+    # same tag as a record (eg. the Emulator of an EmulatorPlatform).  Tracking
+    # the depth costs about as much as the parsing, so iter_records doesn't.
+    depth = 0
+    for event, elem in XML_BACKENDS.get(backend, ET).iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        fields = recordFields.get(elem.tag)
+        if fields is None:
+            continue
+        values = {}
+        for child in elem:
+            if child.tag in fields:
+                values[child.tag] = child.text
+        yield elem.tag, values
+        elem.clear()
+
+###############################################################################
+# BASIC TESTS
+###############################################################################
+
+def main():
+    """ Benchmarks each available backend and checks they return the same records """
+    import sys
+    import time
+    import glob
+    import os
+
+    if len(sys.argv) < 2:
+        print("usage: lbxml.py Launchbox_dir [platform file ...]")
+        return
+    files = sys.argv[2:]
+    if not files:
+        # Use the largest platform files
+        files = glob.glob(os.path.join(sys.argv[1], 'Data', 'Platforms', '*.xml'))
+        files = sorted(files, key=os.path.getsize, reverse=True)[:3]
+
+    fields = [ 'ApplicationPath', 'Title', 'ReleaseDate', 'Publisher', 'Genre', 'PlayCount', ]
+    for fileName in files:
+        print("%s (%d bytes)" % (fileName, os.path.getsize(fileName)))
+        reference = None
+        for backend in XML_BACKEND_PREFERENCE:
+            if backend not in XML_BACKENDS:
+                continue
+            start = time.time()
+            tree = parse(fileName, backend)
+            parseTime = time.time() - start
+            del tree
+
+            start = time.time()
+            records = list(iter_records(fileName, 'Game', fields, backend))
+            iterTime = time.time() - start
+
+            if reference is None:
+                reference = records
+            result = 'identical' if records == reference else 'DIFFERENT'
+            print("  %-12s parse: %7.3fs  iter_records: %7.3fs  %d games, %s" % (backend, parseTime, iterTime, len(records), result))
+
+if __name__ == "__main__":
+    main()
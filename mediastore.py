@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# mediastore.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import shutil
+import hashlib
+
+from fileutil import make_dirs, write_atomic
+
+MEDIA_STORE_DIR = os.path.join('cache', 'media')
+
+class MediaStore(object):
+    """
+    Content addressed store for downloaded media.  Each file is kept once,
+    named after its md5, and placed into the LaunchBox media folders with a
+    hardlink (or a copy when linking is not possible).
+    """
+    def __init__(self, storedir=MEDIA_STORE_DIR, verbose=False):
+        self.storedir = storedir
+        self.verbose = verbose
+
+    def GetPath(self, md5):
+        md5 = md5.lower()
+        return os.path.join(self.storedir, md5[:2], md5)
+
+    def Contains(self, md5):
+        if not md5:
+            return False
+        return os.path.isfile(self.GetPath(md5))
+
+    def Verify(self, md5):
+        """
+        Checks a stored file still matches its hash.  Placed media shares the
+        stored file when hardlinked, so corrupting one corrupts the other.
+        A damaged file is removed from the store.
+        """
+        if not self.Contains(md5):
+            return False
+        path = self.GetPath(md5)
+        h = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024*1024), b''):
+                h.update(block)
+        if h.hexdigest() == md5.lower():
+            return True
+        print("    Removing damaged media from store: %s" % path)
+        os.remove(path)
+        return False
+
+    def Add(self, data, md5=None):
+        """
+        Adds data to the store and returns its md5.  If an expected md5 is
+        given and does not match, the data is stored under its real md5.
+        """
+        actualMd5 = hashlib.md5(data).hexdigest()
+        if md5 and md5.lower() != actualMd5:
+            print("    Media hash mismatch, expected %s got %s" % (md5.lower(), actualMd5))
+
+        path = self.GetPath(actualMd5)
+        if os.path.isfile(path):
+            return actualMd5
+        # Written atomically so an interrupted download never leaves a
+        # partial file under a valid hash.  If another process stored the
+        # same media first it is replaced with identical data.
+        write_atomic(path, data)
+        return actualMd5
+
+    def Place(self, md5, destPath, replace=False):
+        """ Links (or copies) the stored media to destPath """
+        make_dirs(os.path.dirname(destPath))
+        srcPath = self.GetPath(md5)
+        # When replacing, build the new file next to the old one and swap them
+        placePath = destPath + '.tmp' if replace else destPath
+        if replace and os.path.exists(placePath):
+            os.remove(placePath)
+        try:
+            os.link(srcPath, placePath)
+            if self.verbose:
+                print("    Linked %s" % srcPath)
+        except (AttributeError, OSError):
+            # Python 2 on Windows has no os.link and links cannot cross devices
+            shutil.copyfile(srcPath, placePath)
+            if self.verbose:
+                print("    Copied %s" % srcPath)
+        if replace:
+            try:
+                os.rename(placePath, destPath)
+            except OSError:
+                # Windows will not rename over an existing file
+                os.remove(destPath)
+                os.rename(placePath, destPath)
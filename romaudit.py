@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# romaudit.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+from multiprocessing.pool import ThreadPool
+
+# The scandir package (os.scandir in Python 3) reads a directory without
+# the extra calls os.listdir makes on Windows, use it when installed
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+ROM_OK = 'ok'
+ROM_CASE_MISMATCH = 'case mismatch'
+ROM_MOVED = 'moved'
+ROM_MISSING = 'missing'
+# The rom's directory exists but couldn't be listed (permissions or a network error)
+ROM_UNREADABLE = 'unreadable'
+
+# Directory listings are mostly waiting on the network for SMB/NFS libraries
+ROM_AUDIT_WORKERS = 16
+
+class RomAudit(object):
+    """
+    Checks that the roms LaunchBox refers to exist.  Each directory is listed
+    once, in parallel, instead of checking every rom.  A rom that is missing
+    from its directory but found in another audited directory is reported
+    as moved.
+    """
+    def __init__(self, LaunchBoxBaseDir, workers=ROM_AUDIT_WORKERS, verbose=False):
+        self.lbPath = LaunchBoxBaseDir
+        self.workers = workers
+        self.verbose = verbose
+        # { normcase(rom path): (status, LB application path, actual path) }
+        self.results = {}
+
+    def GetRomPath(self, applicationPath):
+        """ Returns the absolute path of a LB ApplicationPath (relative to the LB directory) """
+        if os.sep != '\\':
+            applicationPath = applicationPath.replace('\\', os.sep)
+        return os.path.abspath(os.path.join(self.lbPath, applicationPath))
+
+    def Audit(self, applicationPaths):
+        """ Audits a list of LB ApplicationPaths, returns the number of problems found """
+        romPaths = {}
+        for applicationPath in applicationPaths:
+            romPaths[self.GetRomPath(applicationPath)] = applicationPath
+        directories = sorted(set([ os.path.dirname(romPath) for romPath in romPaths ]))
+
+        pool = ThreadPool(max(1, min(self.workers, len(directories))))
+        try:
+            listings = dict(zip(directories, pool.map(list_directory, directories)))
+        finally:
+            pool.close()
+            pool.join()
+
+        # Every file of the audited directories by lower case name, to find moved roms
+        lowerNames = {}
+        for directory in directories:
+            for name in listings[directory] or []:
+                lowerNames.setdefault(name.lower(), []).append(os.path.join(directory, name))
+
+        problems = 0
+        for romPath, applicationPath in sorted(romPaths.items()):
+            directory, name = os.path.split(romPath)
+            names = listings[directory]
+            status = ROM_MISSING
+            actualPath = None
+            if names is None:
+                status = ROM_UNREADABLE
+            elif name in names:
+                status = ROM_OK
+                actualPath = romPath
+            else:
+                candidates = lowerNames.get(name.lower(), [])
+                sameDir = [ path for path in candidates if os.path.dirname(path) == directory ]
+                if sameDir:
+                    status = ROM_CASE_MISMATCH
+                    actualPath = sameDir[0]
+                elif candidates:
+                    status = ROM_MOVED
+                    actualPath = candidates[0]
+            if status != ROM_OK:
+                problems += 1
+            self.results[os.path.normcase(romPath)] = (status, applicationPath, actualPath)
+        return problems
+
+    def Update(self, audit):
+        """ Replaces the results of the roms another RomAudit checked again """
+        self.results.update(audit.results)
+
+    def GetStatus(self, applicationPath):
+        """ Returns (status, actual path), roms that were not audited are assumed to be ok """
+        result = self.results.get(os.path.normcase(self.GetRomPath(applicationPath)))
+        if result is None:
+            return ROM_OK, self.GetRomPath(applicationPath)
+        return result[0], result[2]
+
+    def IsMissing(self, applicationPath):
+        """
+        True if the rom isn't where LB expects it (moved roms can't be launched
+        either).  Roms in directories that couldn't be read may well exist, so
+        they aren't missing.
+        """
+        return self.GetStatus(applicationPath)[0] in [ ROM_MISSING, ROM_MOVED ]
+
+    def Report(self):
+        counts = {}
+        for status, applicationPath, actualPath in sorted(self.results.values(), key=lambda result: result[1]):
+            counts[status] = counts.get(status, 0) + 1
+            if status == ROM_OK:
+                continue
+            if actualPath:
+                print( ("  %s: %s (found %s)" % (status.capitalize(), applicationPath, actualPath)).encode('utf-8') )
+            else:
+                print( ("  %s: %s" % (status.capitalize(), applicationPath)).encode('utf-8') )
+        print("Audited %d roms: %d ok, %d missing, %d moved, %d case mismatched, %d unreadable." % (len(self.results),
+            counts.get(ROM_OK, 0), counts.get(ROM_MISSING, 0), counts.get(ROM_MOVED, 0), counts.get(ROM_CASE_MISMATCH, 0), counts.get(ROM_UNREADABLE, 0)))
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def list_directory( directory ):
+    """
+    Returns the set of names in a directory, an empty set if it doesn't
+    exist, or None if it can't be read
+    """
+    try:
+        if scandir is not None:
+            return set([ entry.name for entry in scandir(directory) ])
+        return set(os.listdir(directory))
+    except OSError as exc:
+        if exc.errno in [ errno.ENOENT, errno.ENOTDIR ]:
+            return set()
+        print( ("  Can't read %s: %s" % (directory, exc.strerror)).encode('utf-8') )
+        return None
@@ -16,22 +16,147 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
-import xml.etree.ElementTree as ET
 import os
-import urllib2, urllib
+import urllib
 import binascii
 import zipfile
 import zlib
+import hashlib
+import json
+import shlex
+from multiprocessing.pool import ThreadPool
+
+import lbxml
+import cachefile
+from fileutil import write_atomic
+from transport import UrlTransport
 
 SS_USER_INFO_CMD = "ssuserInfos"
 SS_SYSTEMS_LIST_CMD = "systemesListe"
 SS_GAME_INFO_CMD = "jeuInfos"
 SS_GAME_INFO_PARMS = [ 'crc', 'md5', 'sha1', 'systemeid', 'romtype', 'romnom', 'romtaille', ]
 
+# Locale of the media used when several are available, media without a
+# locale is stored as 'all'
+SS_LOCALE_PREFERENCE = ['us','us1','wor','eu','jp',]
+SS_MEDIA_NO_LOCALE = 'all'
+SS_MEDIA_HASH_TYPES = [ 'crc', 'md5', 'sha1', ]
+# The media table of a cached response is saved next to it with this suffix
+SS_MEDIA_TABLE_SUFFIX = '.media.json'
+
+class MediaEntry(object):
+    """ The url and hashes of one media file """
+    __slots__ = ( 'url', 'crc', 'md5', 'sha1', )
+
+    def __init__(self, url=None, crc=None, md5=None, sha1=None):
+        self.url = url
+        self.crc = crc
+        self.md5 = md5
+        self.sha1 = sha1
+
+    def get(self, key, default=None):
+        """ Dictionary style access, eg. media.get('md5') """
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+class MediaTable(object):
+    """
+    The media of a response as { name: { locale: MediaEntry } }.  The entry
+    to use for each name (the first locale of the preference list that is
+    available) is resolved once, when the table is built or loaded.
+    """
+    __slots__ = ( 'media', 'preferred', 'localePreference', )
+
+    def __init__(self, media=None, localePreference=SS_LOCALE_PREFERENCE):
+        self.media = media if media is not None else {}
+        self.Resolve(localePreference)
+
+    @classmethod
+    def FromElement(cls, medias, localePreference=SS_LOCALE_PREFERENCE, verbose=False):
+        """
+        Builds the table from a <medias> element in a single pass.  Tags look
+        like media_<name>[_<locale>][_<hash type>], eg. media_wheel_us_md5,
+        and may be grouped under a parent such as <media_wheels>.
+        """
+        media = {}
+        for elem in medias.iter():
+            # lxml keeps comments, their tag is a function
+            if len(elem) or not isinstance(elem.tag, basestring) or not elem.tag.startswith('media_'):
+                continue
+            postfixes = elem.tag[6:].split('_')
+            name = postfixes[0]
+            locale = SS_MEDIA_NO_LOCALE
+            if len(postfixes) == 1:
+                # No postfix, it must be a URL
+                elementType = 'url'
+            elif len(postfixes) == 2:
+                # One postfix, that can specify a type or be a locale + url
+                if postfixes[1] in SS_MEDIA_HASH_TYPES:
+                    elementType = postfixes[1]
+                else:
+                    locale = postfixes[1]
+                    elementType = 'url'
+            else:
+                locale = postfixes[1]
+                elementType = postfixes[2]
+                if elementType not in SS_MEDIA_HASH_TYPES:
+                    continue
+            # Work around for bug in xml from screen scaper, bezel names are inconsistent
+            if name.find('bezel-') != -1:
+                name = 'bezel'+name.strip('bezel-')
+            locales = media.setdefault(name, {})
+            if locale not in locales:
+                if verbose:
+                    print("  Found %s (%s)" % (name, locale))
+                locales[locale] = MediaEntry()
+            setattr(locales[locale], elementType, elem.text)
+        return cls(media, localePreference)
+
+    def Resolve(self, localePreference):
+        self.localePreference = localePreference
+        self.preferred = {}
+        for name, locales in self.media.items():
+            for locale in localePreference:
+                if locale in locales:
+                    break
+            else:
+                # Prefer media without a locale, then any locale (always the same one)
+                locale = SS_MEDIA_NO_LOCALE if SS_MEDIA_NO_LOCALE in locales else sorted(locales.keys())[0]
+            self.preferred[name] = (locale, locales[locale])
+
+    def __contains__(self, name):
+        return name in self.media
+
+    def GetPreferred(self, name):
+        """ Returns (locale, MediaEntry) for the preferred locale of a media, or None """
+        return self.preferred.get(name)
+
+    def GetLocales(self, name):
+        return sorted(self.media.get(name, {}).keys())
+
+    def Save(self, fileName):
+        media = {}
+        for name, locales in self.media.items():
+            media[name] = dict([ (locale, [ entry.url, entry.crc, entry.md5, entry.sha1 ]) for locale, entry in locales.items() ])
+        write_atomic(fileName, json.dumps(media))
+
+    @classmethod
+    def Load(cls, fileName, localePreference=SS_LOCALE_PREFERENCE):
+        """ Returns the table saved in fileName, or None if it is missing or damaged """
+        try:
+            with open(fileName, 'r') as f:
+                saved = json.load(f)
+            media = {}
+            for name, locales in saved.items():
+                media[name] = dict([ (locale, MediaEntry(*values)) for locale, values in locales.items() ])
+        except (IOError, ValueError, TypeError, AttributeError):
+            return None
+        return cls(media, localePreference)
+
 class ScreenScraper(object):
     SS_BASE_URL = "https://www.screenscraper.fr/api/%s.php?"
 
-    def __init__(self, devid, devpassword, softname, ssid, sspassword, verbose=False):
+    def __init__(self, devid, devpassword, softname, ssid, sspassword, verbose=False, transport=None, cachedir=None):
         self.parameters = {}
         self.parameters['devid'] = devid
         self.parameters['devpassword'] = devpassword
@@ -41,7 +166,9 @@ class ScreenScraper(object):
         self.parameters['output'] = 'xml'
         self.verbose = verbose
         self.command = None
-        self.cachedir = 'cache'
+        self.cachedir = cachedir if cachedir is not None else cachefile.CACHE_DIR
+        # The transport sends the requests, it can be replaced to record or replay responses
+        self.transport = transport if transport is not None else UrlTransport()
 
     def SendRequest(self):
         if not self.command:
@@ -53,8 +180,7 @@ class ScreenScraper(object):
         if self.verbose:
             print(requestUrl)
 
-        response = urllib2.urlopen(requestUrl)
-        output = response.read()
+        output = self.transport.Get(requestUrl)
         # Unicode characters are often received, so format accordingly
         output = unicode(output,'utf-8')
         if not output.startswith('<?xml version="1.0" encoding="UTF-8" ?>'):
@@ -66,11 +192,11 @@ class UserInfo(ScreenScraper):
     """ This class is used to obtain user information. """
     USER_INFO = ['id', 'niveau', 'contribution', 'uploadsysteme', 'uploadinfos', 'romasso', 'uploadmedia', 'maxthreads', 'maxdownloadspeed', 'visites', 'datedernierevisite', 'favregion',]
 
-    def __init__(self, devid, devpassword, softname, ssid, sspassword, verbose=False):
-        super(UserInfo, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose)
+    def __init__(self, devid, devpassword, softname, ssid, sspassword, verbose=False, transport=None, cachedir=None):
+        super(UserInfo, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose, transport, cachedir)
         self.command = SS_USER_INFO_CMD
         xml = self.SendRequest()
-        self.root = ET.fromstring(xml.encode('utf-8'))
+        self.root = lbxml.fromstring(xml.encode('utf-8'))
         if self.verbose:
             print("Created UserInfo class.")
 
@@ -92,18 +218,21 @@ SS_SYSTEM_XML_FILE = "screenscraper.fr-systemesListe.xml"
 
 class SystemList(ScreenScraper):
     """ This class is used to obtain the system list and associated media. """
-    def __init__(self, devid, devpassword, softname, ssid, sspassword, updateCache=False, verbose=False):
-        super(SystemList, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose)
+    def __init__(self, devid, devpassword, softname, ssid, sspassword, updateCache=False, verbose=False, transport=None, cachedir=None):
+        super(SystemList, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose, transport, cachedir)
 
         self.command = SS_SYSTEMS_LIST_CMD
 
         systemXmlFile = os.path.join( self.cachedir, SS_SYSTEM_XML_FILE )
-        if updateCache or not os.path.isfile( systemXmlFile ):
-            with open(systemXmlFile, 'w') as f:
-                f.write(self.SendRequest().encode('utf-8'))
-                f.close()
-
-        self.root = ET.parse(systemXmlFile)
+        self.root = None if updateCache else cachefile.read_xml(systemXmlFile)
+        if self.root is None:
+            # Every scraper process needs the system list, only one fetches it
+            with cachefile.CacheLock(systemXmlFile):
+                self.root = None if updateCache else cachefile.read_xml(systemXmlFile)
+                if self.root is None:
+                    xml = self.SendRequest().encode('utf-8')
+                    write_atomic(systemXmlFile, xml)
+                    self.root = lbxml.fromstring(xml)
         if self.verbose:
             print("Created SystemList class.")
 
@@ -159,13 +288,8 @@ class SystemList(ScreenScraper):
                 print("  %s: %s" % (item, systeminfo[item]))
         return systeminfo
 
-    def GetAvailableMedia(self, systemid):
-        """
-        Media Dictionary looks like this:
-          --mediaCategory--   --list of mediaEntries--
-        { 'logosmonochrome': [{'url': 'http...', 'region': 'jp', 'crc': 'XYZ', 'md5': 'XXX', 'sha1': 'YYY'}, ...]},
-        ...
-        """
+    def GetAvailableMedia(self, systemid, localePreference=SS_LOCALE_PREFERENCE):
+        """ Returns a MediaTable of the system's media """
         if self.verbose:
             print("Getting system media for id %s." % systemid)
 
@@ -173,14 +297,64 @@ class SystemList(ScreenScraper):
         if system is None:
             return None
 
-        try:
-            medias = system.find('medias')
-        except:
-            return availableMedia
+        medias = system.find('medias')
+        if medias is None:
+            return None
 
-        return get_media(medias, self.verbose)
+        return MediaTable.FromElement(medias, localePreference, self.verbose)
 
-def get_crc( romPath ):
+# Roms that are descriptors or images of discs, ScreenScraper knows these by
+# the hashes of their primary data track
+DISC_IMAGE_EXTENSIONS = [ '.cue', '.gdi', '.m3u', '.iso', ]
+HASH_BUFFER_SIZE = 4*1024*1024
+SS_HASH_CACHE_FILE = "hashes.json"
+
+class HashCache(object):
+    """
+    Remembers the hashes of files so large images are only hashed once.  An
+    entry is reused while the file's size and modification time are unchanged.
+    """
+    def __init__(self, cacheFileName=None):
+        self.cacheFileName = cacheFileName
+        self.modified = False
+        self.hashes = self.Load()
+
+    def Get(self, path):
+        """ Returns { 'crc': .., 'md5': .., 'sha1': .., 'size': .. } for a file """
+        key = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self.hashes.get(key)
+        if entry is None or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime:
+            entry = hash_file(path)
+            entry['mtime'] = st.st_mtime
+            self.hashes[key] = entry
+            self.modified = True
+        return entry
+
+    def Load(self):
+        """ Returns the hashes saved in the cache file """
+        if not self.cacheFileName or not os.path.isfile(self.cacheFileName):
+            return {}
+        try:
+            with open(self.cacheFileName, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            print("    Ignoring corrupt hash cache: %s" % self.cacheFileName)
+            return {}
+
+    def Save(self):
+        if not self.cacheFileName or not self.modified:
+            return
+        # Other processes may share the cache file, so merge in what they
+        # saved since we loaded it, keeping the newest entry for each file
+        with cachefile.CacheLock(self.cacheFileName):
+            for path, entry in self.Load().items():
+                if path not in self.hashes or self.hashes[path]['mtime'] < entry['mtime']:
+                    self.hashes[path] = entry
+            write_atomic(self.cacheFileName, json.dumps(self.hashes))
+        self.modified = False
+
+def get_crc( romPath, hashCache=None ):
     # Check if there is a separate CRC file that we should use
     if os.path.exists(romPath+'.crc'):
         with open(romPath+'.crc', 'r') as f:
@@ -201,12 +375,14 @@ def get_crc( romPath ):
             if len(info) == 1:
                 print("    Using ZIP file CRC")
                 return "%08X" % info[0].CRC
-        return crc32_from_file(romPath)
+        if hashCache is None:
+            hashCache = HashCache()
+        return hashCache.Get(resolve_disc_image(romPath))['crc']
 
 class GameInfo(ScreenScraper):
     """ This class is used to obtain the game information and associated media. """
-    def __init__(self, devid, devpassword, softname, ssid, sspassword, systemId, romPath=None, romName=None, crc=None, md5=None, sha1=None, romType=None, romSize=None, gameTitle=None, updateCache=False, verbose=False):
-        super(GameInfo, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose)
+    def __init__(self, devid, devpassword, softname, ssid, sspassword, systemId, romPath=None, romName=None, crc=None, md5=None, sha1=None, romType=None, romSize=None, gameTitle=None, updateCache=False, verbose=False, transport=None, hashCache=None, cachedir=None):
+        super(GameInfo, self).__init__(devid, devpassword, softname, ssid, sspassword, verbose, transport, cachedir)
 
         # import pdb; pdb.set_trace()
         self.command = SS_GAME_INFO_CMD
@@ -223,12 +399,30 @@ class GameInfo(ScreenScraper):
 
         gameFileName = ''
         zipRomName = ''
+        imagePath = None
+        if hashCache is None:
+            hashCache = HashCache()
 
         cacheFileExists = False
+        cachedRoot = None
+        self.mediaTable = None
         if romPath is not None:
             gameFileName = os.path.split(romPath)[1]
             cacheFileName = os.path.join(self.cachedir, systemId, gameFileName) + '.xml'
-            cacheFileExists = os.path.exists(cacheFileName) 
+            if updateCache is False:
+                # The media table saved with the response avoids parsing it
+                self.mediaTable = load_media_table(cacheFileName)
+                if self.mediaTable is None:
+                    # A damaged cache file is removed and fetched again
+                    cachedRoot = cachefile.read_xml(cacheFileName)
+            cacheFileExists = self.mediaTable is not None or cachedRoot is not None
+
+            # Descriptors (.cue, .gdi, .m3u) are tiny text files, ScreenScraper
+            # identifies these games by the name, size and hashes of the data track
+            if os.path.splitext(romPath)[1].lower() in DISC_IMAGE_EXTENSIONS:
+                imagePath = resolve_disc_image(romPath)
+                if romName is None:
+                    romName = os.path.split(imagePath)[1]
 
             # If this is a zipfile, get the gamename and crc from inside the zip
             if os.path.splitext(romPath)[1].lower() == '.zip':
@@ -243,11 +437,10 @@ class GameInfo(ScreenScraper):
         else:
             self.parameters['romnom'] = gameFileName
 
-        self.parameters['crc'] = None
         if crc is not None:
             self.parameters['crc'] = crc
-        elif romPath is not None and cacheFileExists is False:
-            crc = get_crc(romPath)
+        elif romPath is not None and (updateCache is True or cacheFileExists is False):
+            crc = get_crc(romPath, hashCache)
             if crc is None:
                 # If none is returned it means an empty CRC file was found, if
                 # we are not forcing updates, go ahead and report rom not found
@@ -255,14 +448,21 @@ class GameInfo(ScreenScraper):
                     raise RomNotFoundError(self.parameters['systemeid'], self.parameters['romnom'], None)
             else:
                 self.parameters['crc'] = crc
-        
+                if imagePath is not None and not os.path.exists(romPath+'.crc'):
+                    # Already hashed by get_crc, so these come from the cache
+                    hashes = hashCache.Get(imagePath)
+                    self.parameters.setdefault('md5', hashes['md5'])
+                    self.parameters.setdefault('sha1', hashes['sha1'])
+                    self.parameters.setdefault('romtaille', hashes['size'])
+
         # Only issue a command if there is no cache file or we want to update the cache file
         if updateCache is True or cacheFileExists is False:
             try:
                 xml = self.SendRequest()
             except InvalidResponseError:
-                # Retry without the CRC and stripped name
-                del self.parameters['crc']
+                # Retry without the hashes and stripped name
+                for parameter in [ 'crc', 'md5', 'sha1', ]:
+                    self.parameters.pop(parameter, None)
                 self.parameters['romnom'] = self.parameters['romnom'].replace('[','(').split('(')[0].strip()
                 try:
                     xml = self.SendRequest()
@@ -277,45 +477,43 @@ class GameInfo(ScreenScraper):
                             f.close()
                         raise RomNotFoundError(self.parameters['systemeid'], self.parameters['romnom'], e.response)
 
-            if not os.path.exists(os.path.dirname(cacheFileName)):
-                try:
-                    os.makedirs(os.path.dirname(cacheFileName))
-                except OSError as exc: # Guard against race condition
-                    if exc.errno != errno.EEXIST:
-                        raise
-
-            with open(cacheFileName, 'w') as f:
-                f.write(xml.encode('utf-8'))
-                f.close()
+            # Other processes may be reading the cache, never leave a partial file
+            write_atomic(cacheFileName, xml.encode('utf-8'))
 
-            self.root = ET.fromstring(xml.encode('utf-8'))
+            self.root = lbxml.fromstring(xml.encode('utf-8'))
+            self.SaveMediaTable(cacheFileName)
 
             if self.verbose:
                 print("Created GameInfo class for %s." % self.parameters['romnom'])
+        elif self.mediaTable is not None:
+            # Only the media table was read, the response isn't parsed
+            self.root = None
+            if self.verbose:
+                print("    Using cached media table: %s." % (cacheFileName+SS_MEDIA_TABLE_SUFFIX))
         else:
-            self.root = ET.parse(cacheFileName)
+            self.root = cachedRoot
+            self.SaveMediaTable(cacheFileName)
             if self.verbose:
                 print("    Using cached xml file: %s." % cacheFileName)
 
-    def GetAvailableMedia(self):
-        """
-        Media Dictionary looks like this:
-          --mediaCategory--   --list of mediaEntries--
-        { 'logosmonochrome': [{'url': 'http...', 'region': 'jp', 'crc': 'XYZ', 'md5': 'XXX', 'sha1': 'YYY'}, ...]},
-        ...
-        """
+    def SaveMediaTable(self, cacheFileName):
+        """ Builds the media table from the response and saves it next to the cached response """
+        self.mediaTable = MediaTable()
+        jeu = self.root.find('jeu')
+        if jeu is not None and jeu.find('medias') is not None:
+            self.mediaTable = MediaTable.FromElement(jeu.find('medias'), verbose=self.verbose)
+        self.mediaTable.Save(cacheFileName+SS_MEDIA_TABLE_SUFFIX)
+
+    def GetAvailableMedia(self, localePreference=SS_LOCALE_PREFERENCE):
+        """ Returns a MediaTable of the game's media, or None if it has none """
         if self.verbose:
             print("Getting media for %s." % self.parameters['romnom'])
 
-        try:
-            jue = self.root.find('jeu')
-            medias = jue.find('medias')
-            if medias is None:
-                raise MediaNotFoundError
-        except:
+        if self.mediaTable is None or not self.mediaTable.media:
             return None
-
-        return get_media(medias, self.verbose)
+        if localePreference != self.mediaTable.localePreference:
+            self.mediaTable.Resolve(localePreference)
+        return self.mediaTable
 
 ###############################################################################
 # EXCEPTIONS
@@ -348,72 +546,100 @@ class MediaNotFoundError(Error):
 # GLOBAL FUNCTIONS
 ###############################################################################
 
-def get_media( medias, verbose=False ):
-    availableMedia = {}
-    parse_media_parent( medias, availableMedia, verbose )
-    return availableMedia
+def load_media_table( cacheFileName ):
+    """ Returns the media table saved with a cached response, None if it is missing or older than the response """
+    tableFileName = cacheFileName+SS_MEDIA_TABLE_SUFFIX
+    try:
+        if os.path.getmtime(tableFileName) < os.path.getmtime(cacheFileName):
+            return None
+    except OSError:
+        return None
+    return MediaTable.Load(tableFileName)
 
-def parse_media_parent( parent, availableMedia, verbose=False ):
-    for child in parent:
-        # Check if this child is a parent(has children) and recursively call
-        if len(child.getchildren()) > 0:
-            parse_media_parent( child, availableMedia, verbose)
-        else:
-            element = parse_media_element( child )
-            add_element_to_media( availableMedia, element, verbose )
-
-def add_element_to_media( availableMedia, element, verbose=False ):
-    # Work around for bug in xml from screen scaper, bezel names are inconsistent
-    if element['name'].find('bezel-') is not -1:
-        element['name'] = 'bezel'+element['name'].strip('bezel-')
-    if element['name'] not in availableMedia:
-        availableMedia[element['name']] = {}
-    if element['locale'] not in availableMedia[element['name']]:
-        if verbose is True:
-            print("  Found %s (%s)" % (element['name'],element['locale']))
-        availableMedia[element['name']][element['locale']] = {}
-    availableMedia[element['name']][element['locale']][element['type']] = element['text']
-
-def parse_media_element( child ):
+def resolve_disc_image( romPath ):
     """
-    Returns dictionary:
-    { 'name': 'xyz', 'type': 'crc', 'locale': 'us', 'text': 'blah...' }
-    (type can be: crc, md5, sha1, or url)
+    Returns the file ScreenScraper identifies a rom by.  For a .cue or .gdi
+    this is the primary data track, for a .m3u playlist it is the first disc
+    (itself resolved).  Any other rom, or a descriptor whose files can't be
+    found, is returned unchanged.
     """
-    
-    mediaElement = {}
-    # extract the postfixes from the media tag
-    # Eg. media_logomonochrome_jp_crc or media_logomonochrome_jp
-    postfixes = child.tag.split('media_')[1].split('_')
-    name = postfixes[0]
-    locale = 'all'
-    if len(postfixes) is 1:
-        # URL has an empty postfix, it must be a URL
-        elementType = 'url'
-    elif len(postfixes) is 2:
-        # URL has one postfix, that can specify a type or be a locale + url
-        if postfixes[1] in ['crc','md5','sha1']:
-            elementType = postfixes[1]
-        else:
-            locale = postfixes[1] 
-            elementType = 'url'
-    else:
-        locale = postfixes[1]
-        elementType = postfixes[2]
-    
-    mediaElement['name'] = name
-    mediaElement['type'] = elementType
-    mediaElement['locale'] = locale
-    mediaElement['text'] = child.text
-
-    return mediaElement
-
-def crc32_from_file(filename):
-    print("    Calculating CRC on %s..." % filename)
-    prev = 0
-    for eachLine in open(filename,"rb"):
-        prev = zlib.crc32(eachLine, prev)
-    return "%X"%(prev & 0xFFFFFFFF)
+    ext = os.path.splitext(romPath)[1].lower()
+    if ext not in [ '.cue', '.gdi', '.m3u', ]:
+        return romPath
+    baseDir = os.path.dirname(romPath)
+    try:
+        with open(romPath, 'r') as f:
+            lines = [ line.strip() for line in f.read().splitlines() ]
+    except IOError:
+        return romPath
+
+    tracks = []
+    if ext == '.m3u':
+        discs = [ line for line in lines if line and not line.startswith('#') ]
+        if discs:
+            return resolve_disc_image(os.path.join(baseDir, discs[0]))
+    elif ext == '.cue':
+        # FILE "Game (Track 1).bin" BINARY
+        #   TRACK 01 MODE2/2352
+        fileName = None
+        for line in lines:
+            words = split_descriptor_line(line)
+            if len(words) >= 2 and words[0].upper() == 'FILE':
+                fileName = words[1]
+            elif len(words) >= 3 and words[0].upper() == 'TRACK' and fileName:
+                tracks.append((fileName, words[2].upper() != 'AUDIO'))
+    elif ext == '.gdi':
+        # <track count>
+        # <track> <lba> <type (4 = data)> <sector size> <file name> <offset>
+        for line in lines[1:]:
+            words = split_descriptor_line(line)
+            if len(words) >= 5:
+                tracks.append((words[4], words[2] == '4'))
+
+    # The largest data track holds the game (eg. track 3 of a GD-ROM)
+    candidates = [ os.path.join(baseDir, t[0]) for t in tracks if t[1] ] or [ os.path.join(baseDir, t[0]) for t in tracks ]
+    candidates = [ c for c in candidates if os.path.isfile(c) ]
+    if not candidates:
+        return romPath
+    if ext == '.cue':
+        return candidates[0]
+    return max(candidates, key=os.path.getsize)
+
+def split_descriptor_line( line ):
+    try:
+        return shlex.split(line)
+    except ValueError:
+        return line.split()
+
+HASH_POOL = None
+
+def hash_file( filename ):
+    """
+    Returns the crc, md5, sha1 and size of a file, calculated in a single
+    pass.  The md5 and sha1 of each block are computed in worker threads while
+    the crc is calculated and the next block is read.
+    """
+    global HASH_POOL
+    if HASH_POOL is None:
+        HASH_POOL = ThreadPool(2)
+
+    print("    Calculating hashes on %s..." % filename)
+    crc = 0
+    size = 0
+    md5 = hashlib.md5()
+    sha1 = hashlib.sha1()
+    pending = []
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(HASH_BUFFER_SIZE)
+            for result in pending:
+                result.get()
+            if not block:
+                break
+            pending = [ HASH_POOL.apply_async(md5.update, (block,)), HASH_POOL.apply_async(sha1.update, (block,)) ]
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return { 'crc': "%08X" % (crc & 0xFFFFFFFF), 'md5': md5.hexdigest(), 'sha1': sha1.hexdigest(), 'size': size, }
 
 ###############################################################################
 # BASIC TESTS
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# test_cachefile.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+import lbxml
+from cachefile import CacheLock, read_xml
+
+class CacheLockTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'systems.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testStaleLockIsHeldByOneWaiter(self):
+        lock = CacheLock(self.path)
+        lock.Acquire()
+        # Left behind by a crashed process
+        old = time.time() - 2*lock.stale
+        os.utime(lock.lockFileName, (old, old))
+
+        holders = []
+        overlaps = []
+        def hold():
+            with CacheLock(self.path, timeout=30):
+                holders.append(1)
+                if len(holders) > 1:
+                    overlaps.append(1)
+                time.sleep(0.01)
+                holders.pop()
+        threads = [ threading.Thread(target=hold) for i in range(16) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(sorted(os.listdir(self.dir)), [])
+
+class ReadXmlTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'game.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testBackends(self):
+        for backend in lbxml.XML_BACKENDS:
+            self.assertEqual(read_xml(self.path, backend), None, backend)
+
+            with open(self.path, 'w') as f:
+                f.write('<Data><jeu id="1"/></Data>')
+            self.assertEqual(read_xml(self.path, backend).getroot().find('jeu').get('id'), '1', backend)
+
+            # A damaged file is removed so it is fetched again
+            with open(self.path, 'w') as f:
+                f.write('<Data><jeu>')
+            self.assertEqual(read_xml(self.path, backend), None, backend)
+            self.assertFalse(os.path.exists(self.path), backend)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# test_fieldmap.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import unittest
+
+from lb2am import CompiledFieldMap, ParseFieldMapOverrides
+
+class FieldMapTest(unittest.TestCase):
+    def Columns(self, overrides, values):
+        return CompiledFieldMap(ParseFieldMapOverrides(overrides)).BuildRow(values).split(u';')
+
+    def testDefault(self):
+        columns = self.Columns([], { 'ApplicationPath': u'Super Mario Bros..nes', 'Title': u'Super Mario Bros.' })
+        self.assertEqual(columns[:2], [ u'Super Mario Bros.', u'Super Mario Bros.' ])
+
+    def testOverrideWithoutFunctionUsesValue(self):
+        columns = self.Columns([ 'Name=Title' ], { 'ApplicationPath': u'smb.nes', 'Title': u'Super Mario Bros.' })
+        self.assertEqual(columns[0], u'Super Mario Bros.')
+
+    def testOverrideWithFunction(self):
+        columns = self.Columns([ 'Year=ReleaseDate:year', 'Title=' ], { 'ReleaseDate': u'1985-09-13T00:00:00', 'Title': u'Super Mario Bros.' })
+        self.assertEqual(columns[1], u'')
+        self.assertEqual(columns[4], u'1985')
+
+    def testUnknownField(self):
+        self.assertRaises(ValueError, ParseFieldMapOverrides, [ 'Nope=Title' ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# test_fileplan.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import shutil
+import tempfile
+import unittest
+
+import fileplan
+from lb2am import PlanMergeArtworkToLB
+
+class FilePlanTest(unittest.TestCase):
+    def setUp(self):
+        # The real path, since plans use the absolute path of the current directory
+        self.dir = os.path.realpath(tempfile.mkdtemp())
+        self.planFileName = os.path.join(self.dir, 'plan.json')
+        self.journalFileName = self.planFileName + '.journal'
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def Path(self, name):
+        return os.path.join(self.dir, name)
+
+    def WriteFile(self, name, data):
+        with open(self.Path(name), 'w') as f:
+            f.write(data)
+
+    def ReadFile(self, name):
+        with open(self.Path(name), 'r') as f:
+            return f.read()
+
+    def SavePlan(self, operations):
+        plan = fileplan.FilePlan()
+        for operation, src, dst in operations:
+            plan.Add(operation, self.Path(src), self.Path(dst))
+        self.assertEqual(plan.RemoveConflicts(), [])
+        plan.Save(self.planFileName)
+        return fileplan.FilePlan.Load(self.planFileName)
+
+    def testApplyAndUndo(self):
+        self.WriteFile('a.png', 'a')
+        self.WriteFile('b.png', 'b')
+        plan = self.SavePlan([ (fileplan.PLAN_RENAME, 'a.png', 'x.png'), (fileplan.PLAN_MOVE, 'b.png', os.path.join('sub', 'y.png')) ])
+        self.assertEqual(fileplan.ApplyPlan(plan, self.journalFileName), (2, 0))
+        self.assertEqual(self.ReadFile('x.png'), 'a')
+        self.assertEqual(self.ReadFile(os.path.join('sub', 'y.png')), 'b')
+        self.assertEqual(fileplan.UndoPlan(plan, self.journalFileName), (2, 0))
+        self.assertEqual(self.ReadFile('a.png'), 'a')
+        self.assertEqual(self.ReadFile('b.png'), 'b')
+
+    def testApplyKeepsDestinationCreatedAfterPlanning(self):
+        self.WriteFile('a.png', 'a')
+        self.WriteFile('b.png', 'b')
+        plan = self.SavePlan([ (fileplan.PLAN_RENAME, 'a.png', 'x.png'), (fileplan.PLAN_MOVE, 'b.png', 'y.png') ])
+        self.WriteFile('x.png', 'new x')
+        self.WriteFile('y.png', 'new y')
+
+        self.assertEqual(fileplan.ApplyPlan(plan, self.journalFileName), (0, 2))
+        self.assertEqual(self.ReadFile('x.png'), 'new x')
+        self.assertEqual(self.ReadFile('y.png'), 'new y')
+        self.assertEqual(self.ReadFile('a.png'), 'a')
+        self.assertEqual(self.ReadFile('b.png'), 'b')
+
+        # Nothing was applied, so nothing is undone
+        self.assertEqual(fileplan.UndoPlan(plan, self.journalFileName), (0, 0))
+        self.assertEqual(self.ReadFile('x.png'), 'new x')
+
+    def testResumeRecordsOperationAppliedBeforeCrash(self):
+        self.WriteFile('a.png', 'a')
+        self.WriteFile('b.png', 'b')
+        plan = self.SavePlan([ (fileplan.PLAN_RENAME, 'a.png', 'x.png'), (fileplan.PLAN_MOVE, 'b.png', 'y.png') ])
+        # Interrupted after the first rename, before its journal entry
+        open(self.journalFileName, 'w').close()
+        os.rename(self.Path('a.png'), self.Path('x.png'))
+
+        self.assertEqual(fileplan.ApplyPlan(plan, self.journalFileName), (2, 0))
+        self.assertEqual(fileplan.Journal(self.journalFileName).Read(), set([ 0, 1 ]))
+        self.assertEqual(fileplan.UndoPlan(plan, self.journalFileName), (2, 0))
+        self.assertEqual(self.ReadFile('a.png'), 'a')
+        self.assertEqual(self.ReadFile('b.png'), 'b')
+
+    def testCrossDeviceMove(self):
+        self.WriteFile('a.png', 'a')
+        # Fail renames of the source as if it was on another device
+        renameNoClobber = fileplan.rename_no_clobber
+        def rename_across_devices( src, dst ):
+            if src == self.Path('a.png'):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            renameNoClobber(src, dst)
+        fileplan.rename_no_clobber = rename_across_devices
+        try:
+            entry = (0, [ fileplan.PLAN_MOVE, self.Path('a.png'), self.Path(os.path.join('sub', 'x.png')) ])
+            self.assertEqual(fileplan.run_operation(entry), (0, None))
+        finally:
+            fileplan.rename_no_clobber = renameNoClobber
+        self.assertFalse(os.path.exists(self.Path('a.png')))
+        self.assertEqual(self.ReadFile(os.path.join('sub', 'x.png')), 'a')
+
+    def testCopyKeepsDestination(self):
+        self.WriteFile('a.png', 'a')
+        self.WriteFile('x.png', 'x')
+        with self.assertRaises(OSError) as cm:
+            fileplan.copy_no_clobber(self.Path('a.png'), self.Path('x.png'))
+        self.assertEqual(cm.exception.errno, errno.EEXIST)
+        self.assertEqual(self.ReadFile('x.png'), 'x')
+        self.assertEqual(sorted(os.listdir(self.dir)), [ 'a.png', 'x.png' ])
+
+    def testOnlyCrossDeviceErrorsCopy(self):
+        self.assertTrue(fileplan.is_cross_device_error(OSError(errno.EXDEV, "Invalid cross-device link")))
+        windowsError = OSError(errno.EEXIST, "Cannot create a file when that file already exists")
+        windowsError.winerror = 183
+        self.assertFalse(fileplan.is_cross_device_error(windowsError))
+        windowsError.winerror = fileplan.ERROR_NOT_SAME_DEVICE
+        self.assertTrue(fileplan.is_cross_device_error(windowsError))
+
+    def testRelativePathsAreRejected(self):
+        plan = fileplan.FilePlan()
+        self.assertRaises(ValueError, plan.Add, fileplan.PLAN_RENAME, 'a.png', self.Path('x.png'))
+        self.assertRaises(ValueError, plan.Add, fileplan.PLAN_MOVE, self.Path('a.png'), os.path.join('sub', 'x.png'))
+        self.assertEqual(len(plan), 0)
+
+    def testMergeArtworkPlanIsAbsolute(self):
+        os.makedirs(self.Path(os.path.join('AM', 'scraper', 'Arcade', 'flyer')))
+        self.WriteFile(os.path.join('AM', 'scraper', 'Arcade', 'flyer', 'galaga.png'), 'a')
+        cwd = os.getcwd()
+        os.chdir(self.dir)
+        try:
+            plan = PlanMergeArtworkToLB('LB', 'AM')
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(plan.operations, [ [ fileplan.PLAN_MOVE, self.Path(os.path.join('AM', 'scraper', 'Arcade', 'flyer', 'galaga.png')),
+            self.Path(os.path.join('LB', 'Images', 'Arcade', 'Box - Front', 'galaga.png')) ] ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# test_lbxml.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import errno
+import shutil
+import tempfile
+import unittest
+
+import lbxml
+
+PLATFORM_XML = '''<?xml version="1.0" standalone="yes"?>
+<LaunchBox>
+  <!-- Saved by LaunchBox -->
+  <Game>
+    <ApplicationPath>..\\Games\\SNES\\Pok\xc3\xa9mon.sfc</ApplicationPath>
+    <Title>Pok\xc3\xa9mon &amp; Friends</Title>
+    <Genre />
+    <PlayCount>3</PlayCount>
+  </Game>
+  <Game>
+    <ApplicationPath>..\\Games\\SNES\\Aladdin.sfc</ApplicationPath>
+    <!-- No title -->
+    <PlayCount>0</PlayCount>
+  </Game>
+</LaunchBox>
+'''
+
+EMULATORS_XML = '''<?xml version="1.0" standalone="yes"?>
+<LaunchBox>
+  <Emulator>
+    <ID>1</ID>
+    <ApplicationPath>Emulators\\snes9x.exe</ApplicationPath>
+  </Emulator>
+  <EmulatorPlatform>
+    <Emulator>1</Emulator>
+    <Platform>Super Nintendo Entertainment System</Platform>
+  </EmulatorPlatform>
+</LaunchBox>
+'''
+
+TREE_XML = '''<Data><jeu id="1" romid="2"><noms><nom region="us">Aladdin</nom></noms>text<medias /></jeu></Data>'''
+
+MALFORMED_XML = '''<LaunchBox><Game><Title>Aladdin</Game></LaunchBox>'''
+
+def element_to_tuple( elem ):
+    """ Returns an element and its children as comparable tuples """
+    return (elem.tag, sorted(elem.attrib.items()), elem.text, elem.tail, [ element_to_tuple(child) for child in elem ])
+
+class BackendTest(unittest.TestCase):
+    """ Every backend must return the same results and raise the same errors """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def WriteFile(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def AssertIdentical(self, results):
+        backends = sorted(results)
+        for backend in backends[1:]:
+            self.assertEqual(results[backend], results[backends[0]], "%s differs from %s" % (backend, backends[0]))
+
+    def testParse(self):
+        path = self.WriteFile('tree.xml', TREE_XML)
+        self.AssertIdentical(dict([ (backend, element_to_tuple(lbxml.parse(path, backend).getroot())) for backend in lbxml.XML_BACKENDS ]))
+
+    def testFromString(self):
+        self.AssertIdentical(dict([ (backend, element_to_tuple(lbxml.fromstring(TREE_XML, backend))) for backend in lbxml.XML_BACKENDS ]))
+
+    def testIterRecords(self):
+        path = self.WriteFile('SNES.xml', PLATFORM_XML)
+        fields = [ 'ApplicationPath', 'Title', 'Genre', 'PlayCount' ]
+        results = dict([ (backend, list(lbxml.iter_records(path, 'Game', fields, backend))) for backend in lbxml.XML_BACKENDS ])
+        self.AssertIdentical(results)
+        self.assertEqual(results['ElementTree'][0]['Title'], u'Pok\xe9mon & Friends')
+        self.assertEqual(results['ElementTree'][0]['Genre'], None)
+        self.assertEqual(sorted(results['ElementTree'][1]), [ 'ApplicationPath', 'PlayCount' ])
+
+    def testIterTaggedRecords(self):
+        path = self.WriteFile('Emulators.xml', EMULATORS_XML)
+        recordFields = { 'Emulator': [ 'ID', 'ApplicationPath' ], 'EmulatorPlatform': [ 'Emulator', 'Platform' ] }
+        results = dict([ (backend, list(lbxml.iter_tagged_records(path, recordFields, backend))) for backend in lbxml.XML_BACKENDS ])
+        self.AssertIdentical(results)
+        self.assertEqual([ tag for tag, values in results['ElementTree'] ], [ 'Emulator', 'EmulatorPlatform' ])
+
+    def testMissingFile(self):
+        path = os.path.join(self.dir, 'missing.xml')
+        for backend in lbxml.XML_BACKENDS:
+            for read in [ lambda: lbxml.parse(path, backend),
+                          lambda: list(lbxml.iter_records(path, 'Game', [ 'Title' ], backend)),
+                          lambda: list(lbxml.iter_tagged_records(path, { 'Game': [ 'Title' ] }, backend)) ]:
+                with self.assertRaises(IOError) as cm:
+                    read()
+                self.assertEqual(cm.exception.errno, errno.ENOENT, backend)
+
+    def testMalformed(self):
+        path = self.WriteFile('malformed.xml', MALFORMED_XML)
+        for backend in lbxml.XML_BACKENDS:
+            for read in [ lambda: lbxml.parse(path, backend),
+                          lambda: lbxml.fromstring(MALFORMED_XML, backend),
+                          lambda: list(lbxml.iter_records(path, 'Game', [ 'Title' ], backend)),
+                          lambda: list(lbxml.iter_tagged_records(path, { 'Game': [ 'Title' ] }, backend)) ]:
+                self.assertRaises(lbxml.ParseErrors, read)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# test_mediaindex.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+from lb2am import MediaIndex, PlanRenameLBArtwork
+
+class MediaIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def Index(self, fileNames):
+        for fileName in fileNames:
+            open(os.path.join(self.dir, fileName), 'w').close()
+        return MediaIndex([self.dir])
+
+    def FindBestName(self, index, title):
+        return [ name for path, name, number in index.FindBest(title) ]
+
+    def testExactAndLoose(self):
+        index = self.Index([ "Legend of Zelda_ Link_s Awakening-01.png", "PacMan-01.png" ])
+        self.assertEqual(self.FindBestName(index, u"The Legend of Zelda: Link's Awakening (USA)"), [ u"Legend of Zelda_ Link_s Awakening" ])
+        self.assertEqual(self.FindBestName(index, u"Pac-Man"), [ u"PacMan" ])
+
+    def testSuffixes(self):
+        index = self.Index([ "Final Fantasy VII (Disc 1)-01.png", "Riven (Disk 2)-01.png", "Myst CD1-01.png",
+            "Maniac Mansion Side A-01.png", "Tetris (Rev A)-01.png", "Doom v1.9-01.png" ])
+        self.assertEqual(self.FindBestName(index, u"Final Fantasy VII"), [ u"Final Fantasy VII (Disc 1)" ])
+        self.assertEqual(self.FindBestName(index, u"Riven"), [ u"Riven (Disk 2)" ])
+        self.assertEqual(self.FindBestName(index, u"Myst"), [ u"Myst CD1" ])
+        self.assertEqual(self.FindBestName(index, u"Maniac Mansion"), [ u"Maniac Mansion Side A" ])
+        self.assertEqual(self.FindBestName(index, u"Tetris"), [ u"Tetris (Rev A)" ])
+        self.assertEqual(self.FindBestName(index, u"Doom"), [ u"Doom v1.9" ])
+
+    def testSequelsDoNotMatch(self):
+        index = self.Index([ "Final Fantasy VII-01.png", "Mega Man V-01.png", "Grand Theft Auto V-01.png",
+            "Sonic CD-01.png", "Mario Kart-01.png", "Street Fighter II-01.png" ])
+        for title in [ u"Final Fantasy", u"Mega Man", u"Grand Theft Auto", u"Sonic", u"Mario", u"Street Fighter" ]:
+            self.assertEqual(index.FindBest(title), [], title)
+
+ARCADE_XML = '''<?xml version="1.0" standalone="yes"?>
+<LaunchBox>
+  <Game>
+    <ApplicationPath>galagamw.zip</ApplicationPath>
+    <Title>Galaga (Midway set 1)</Title>
+  </Game>
+  <Game>
+    <ApplicationPath>galaga.zip</ApplicationPath>
+    <Title>Galaga (Namco rev. B)</Title>
+  </Game>
+  <Game>
+    <ApplicationPath>digdug.zip</ApplicationPath>
+    <Title>Dig Dug (rev 2)</Title>
+  </Game>
+</LaunchBox>
+'''
+
+class RenameArtworkTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lbDir = os.path.join(self.dir, 'LaunchBox')
+        self.amDir = os.path.join(self.dir, 'AttractMode')
+        self.imageDir = os.path.join(self.lbDir, 'Images', 'Arcade', 'Box - Front')
+        for directory in [ os.path.join(self.lbDir, 'Data', 'Platforms'), os.path.join(self.amDir, 'romlists'), self.imageDir ]:
+            os.makedirs(directory)
+        with open(os.path.join(self.lbDir, 'Data', 'Platforms', 'Arcade.xml'), 'w') as f:
+            f.write(ARCADE_XML)
+        open(os.path.join(self.amDir, 'romlists', 'Arcade.txt'), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def PlannedRenames(self, fileNames):
+        for fileName in fileNames:
+            open(os.path.join(self.imageDir, fileName), 'w').close()
+        plan = PlanRenameLBArtwork(self.lbDir, self.amDir)
+        return sorted([ (os.path.basename(src), os.path.basename(dst)) for operation, src, dst in plan.operations ])
+
+    def testCloneDoesNotTakeExactlyNamedArt(self):
+        self.assertEqual(self.PlannedRenames([ u"Galaga (Namco rev. B)-01.png" ]), [ (u"Galaga (Namco rev. B)-01.png", u"galaga.png") ])
+
+    def testFuzzyMatchUsesArtNoGameIsNamedAfter(self):
+        self.assertEqual(self.PlannedRenames([ u"Galaga (Namco rev. B)-01.png", u"Dig Dug-01.png" ]),
+            [ (u"Dig Dug-01.png", u"digdug.png"), (u"Galaga (Namco rev. B)-01.png", u"galaga.png") ])
+
+if __name__ == '__main__':
+    unittest.main()
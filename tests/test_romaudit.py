@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# test_romaudit.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+import romaudit
+from romaudit import RomAudit, ROM_OK, ROM_MISSING, ROM_CASE_MISMATCH, ROM_MOVED, ROM_UNREADABLE
+
+class RomAuditTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for directory in [ 'SNES', 'NES', 'Unreadable' ]:
+            os.makedirs(os.path.join(self.dir, 'Games', directory))
+        for fileName in [ os.path.join('SNES', 'Aladdin.sfc'), os.path.join('SNES', 'contra III.sfc'),
+                          os.path.join('NES', 'Zelda.sfc'), os.path.join('NES', 'Punch-Out.nes'),
+                          os.path.join('Unreadable', 'Doom.zip') ]:
+            open(os.path.join(self.dir, 'Games', fileName), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testStatuses(self):
+        unreadable = os.path.join(self.dir, 'Games', 'Unreadable')
+        listDirectory = romaudit.list_directory
+        # Moved roms are found in the other audited directories.  Fail a
+        # listing as if the network share had dropped out
+        romaudit.list_directory = lambda directory: None if directory == unreadable else listDirectory(directory)
+        try:
+            audit = RomAudit(self.dir)
+            roms = { 'Aladdin': 'Games\\SNES\\Aladdin.sfc', 'Contra': 'Games\\SNES\\Contra III.sfc',
+                     'Zelda': 'Games\\SNES\\Zelda.sfc', 'Punch-Out': 'Games\\NES\\Punch-Out.nes',
+                     'Mario': 'Games\\SNES\\Mario.sfc',
+                     'Metroid': 'Games\\GB\\Metroid.gb', 'Doom': 'Games\\Unreadable\\Doom.zip' }
+            self.assertEqual(audit.Audit(roms.values()), 5)
+        finally:
+            romaudit.list_directory = listDirectory
+
+        expected = { 'Aladdin': (ROM_OK, False), 'Punch-Out': (ROM_OK, False), 'Contra': (ROM_CASE_MISMATCH, False), 'Zelda': (ROM_MOVED, True),
+                     'Mario': (ROM_MISSING, True), 'Metroid': (ROM_MISSING, True), 'Doom': (ROM_UNREADABLE, False) }
+        for game, (status, missing) in expected.items():
+            self.assertEqual(audit.GetStatus(roms[game])[0], status, game)
+            self.assertEqual(audit.IsMissing(roms[game]), missing, game)
+        self.assertEqual(audit.GetStatus(roms['Contra'])[1], os.path.join(self.dir, 'Games', 'SNES', 'contra III.sfc'))
+        self.assertEqual(audit.GetStatus(roms['Zelda'])[1], os.path.join(self.dir, 'Games', 'NES', 'Zelda.sfc'))
+
+    def testListDirectory(self):
+        games = os.path.join(self.dir, 'Games')
+        self.assertEqual(romaudit.list_directory(games), set([ 'SNES', 'NES', 'Unreadable' ]))
+        self.assertEqual(romaudit.list_directory(os.path.join(games, 'GB')), set())
+        self.assertEqual(romaudit.list_directory(os.path.join(games, 'SNES', 'Aladdin.sfc')), set())
+
+    @unittest.skipIf(not hasattr(os, 'geteuid') or os.geteuid() == 0, "root can read any directory")
+    def testListUnreadableDirectory(self):
+        unreadable = os.path.join(self.dir, 'Games', 'Unreadable')
+        os.chmod(unreadable, 0)
+        try:
+            self.assertEqual(romaudit.list_directory(unreadable), None)
+        finally:
+            os.chmod(unreadable, 0o755)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# test_screenscraper.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import unittest
+
+import lbxml
+from screenscraper import MediaTable
+
+MEDIAS_XML = '''<medias>
+  <!-- Wheels -->
+  <media_wheels>
+    <media_wheel_jp>http://example.com/wheel_jp.png</media_wheel_jp>
+    <media_wheel_eu>http://example.com/wheel_eu.png</media_wheel_eu>
+    <media_wheel_eu_md5>0123456789abcdef</media_wheel_eu_md5>
+  </media_wheels>
+  <media_box2d>http://example.com/box2d.png</media_box2d>
+  <media_box2d_crc>89abcdef</media_box2d_crc>
+  <media_bezel-16-9_fr>http://example.com/bezel.png</media_bezel-16-9_fr>
+</medias>'''
+
+class MediaTableTest(unittest.TestCase):
+    def testFromElement(self):
+        for backend in lbxml.XML_BACKENDS:
+            table = MediaTable.FromElement(lbxml.fromstring(MEDIAS_XML, backend), [ 'eu', 'jp' ])
+            self.assertEqual(sorted(table.media), [ 'bezel16-9', 'box2d', 'wheel' ], backend)
+            locale, entry = table.GetPreferred('wheel')
+            self.assertEqual((locale, entry.url, entry.md5), ('eu', 'http://example.com/wheel_eu.png', '0123456789abcdef'), backend)
+            self.assertEqual(table.GetLocales('wheel'), [ 'eu', 'jp' ], backend)
+            locale, entry = table.GetPreferred('box2d')
+            self.assertEqual((entry.url, entry.crc), ('http://example.com/box2d.png', '89abcdef'), backend)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# transport.py - https://github.com/sharkusk/lb2am
+# Copyright (C) 2017 - Marcus Kellerman
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import urllib2, urllib
+import urlparse
+import StringIO
+
+from fileutil import make_dirs
+
+# Query parameters that identify the user rather than the request.  They are
+# not recorded and are ignored when matching requests during replay.
+CREDENTIAL_PARAMETERS = [ 'devid', 'devpassword', 'softname', 'ssid', 'sspassword', ]
+
+class UrlTransport(object):
+    """ Sends requests to the network, this is the default transport. """
+    def Get(self, url):
+        response = urllib2.urlopen(url)
+        return response.read()
+
+class RecordTransport(object):
+    """ Passes requests to another transport and records the responses to an archive. """
+    def __init__(self, archivedir, transport=None, verbose=False):
+        self.archivedir = archivedir
+        self.transport = transport if transport is not None else UrlTransport()
+        self.verbose = verbose
+
+    def Get(self, url):
+        try:
+            data = self.transport.Get(url)
+        except urllib2.HTTPError as e:
+            body = e.read()
+            write_archive_entry(self.archivedir, url, e.code, body)
+            # The body has been consumed, so raise a copy the caller can still read
+            raise urllib2.HTTPError(e.url, e.code, e.msg, e.hdrs, StringIO.StringIO(body))
+        write_archive_entry(self.archivedir, url, 200, data)
+        if self.verbose:
+            print("    Recorded %s" % strip_credentials(url))
+        return data
+
+class ReplayTransport(object):
+    """
+    Serves responses from an archive created by RecordTransport.  Latency,
+    random errors and a request rate limit can be added to simulate the
+    behavior of the real server.
+    """
+    def __init__(self, archivedir, latency=0.0, errorRate=0.0, maxRequestsPerSecond=0.0, seed=None, verbose=False):
+        self.archivedir = archivedir
+        self.latency = latency
+        self.errorRate = errorRate
+        self.maxRequestsPerSecond = maxRequestsPerSecond
+        self.verbose = verbose
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.nextRequestTime = 0.0
+        self.requestCount = 0
+
+    def Throttle(self):
+        if not self.maxRequestsPerSecond:
+            return
+        with self.lock:
+            now = time.time()
+            start = max(now, self.nextRequestTime)
+            self.nextRequestTime = start + 1.0 / self.maxRequestsPerSecond
+        if start > now:
+            time.sleep(start - now)
+
+    def Get(self, url):
+        self.Throttle()
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requestCount += 1
+            injectError = self.errorRate and self.random.random() < self.errorRate
+        if injectError:
+            raise urllib2.URLError("Replay: injected error")
+
+        entry = read_archive_entry(self.archivedir, url)
+        if entry is None:
+            if self.verbose:
+                print("    Not in archive: %s" % strip_credentials(url))
+            raise urllib2.HTTPError(url, 404, "Not in replay archive", None, StringIO.StringIO(''))
+        status, data = entry
+        if status != 200:
+            raise urllib2.HTTPError(url, status, "Replayed error", None, StringIO.StringIO(data))
+        return data
+
+###############################################################################
+# GLOBAL FUNCTIONS
+###############################################################################
+
+def strip_credentials( url ):
+    """ Returns the url without credentials and with the query parameters sorted """
+    parts = urlparse.urlsplit(url)
+    query = [ (k, v) for k, v in urlparse.parse_qsl(parts.query, keep_blank_values=True) if k not in CREDENTIAL_PARAMETERS ]
+    query.sort()
+    return urlparse.urlunsplit((parts.scheme, parts.netloc, parts.path, urllib.urlencode(query), ''))
+
+def get_archive_path( archivedir, url ):
+    key = hashlib.sha1(strip_credentials(url)).hexdigest()
+    return os.path.join(archivedir, key[:2], key)
+
+def write_archive_entry( archivedir, url, status, data ):
+    path = get_archive_path(archivedir, url)
+    make_dirs(os.path.dirname(path))
+    with open(path+'.body', 'wb') as f:
+        f.write(data)
+    # The meta file is written last, an entry without one is incomplete
+    with open(path+'.json', 'w') as f:
+        json.dump({ 'url': strip_credentials(url), 'status': status }, f)
+
+def read_archive_entry( archivedir, url ):
+    """ Returns (status, data) or None if the url was not recorded """
+    path = get_archive_path(archivedir, url)
+    try:
+        with open(path+'.json', 'r') as f:
+            meta = json.load(f)
+        with open(path+'.body', 'rb') as f:
+            data = f.read()
+    except IOError:
+        return None
+    return meta['status'], data